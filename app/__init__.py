@@ -30,6 +30,7 @@ def create_app():
     from app.routes.waf.exception_pp4_routes import exception_pp4_bp
     from app.routes.waf.mark_fp import mark_fp_bp
     from app.routes.waf.ai_exception import ai_exception_bp
+    from app.routes.stats_routes import stats_bp
 
     from app.slack.events import register_message_event
 
@@ -50,7 +51,21 @@ def create_app():
     from app.routes.waf.clear_logs import clear_logs_bp
     app.register_blueprint(clear_logs_bp)
     app.register_blueprint(ai_exception_bp)
+    app.register_blueprint(stats_bp)
     
     register_message_event(app)
+
+    # ====== BACKGROUND: cảnh báo ngưỡng Metricbeat vào kênh #system-metrics ======
+    from app.routes.elk.metric import ALLOWED_CHANNEL as METRIC_CHANNEL
+    from app.services.elk.metric_watcher import start_metric_watcher
+    start_metric_watcher(client, METRIC_CHANNEL)
+
+    # ====== BACKGROUND: đóng local các case đã đóng trên Kibana ======
+    from app.services.waf.case_reconciler import start_case_reconciler
+    start_case_reconciler()
+
+    # ====== BACKGROUND: mirror whitelist/blacklist WAF (RadixTree) ======
+    from app.services.waf.ip_lists import start_ip_list_mirror
+    start_ip_list_mirror()
     
     return app
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, Response, current_app
-from app.services.elk.metric import get_metric
+from app.services.elk.metric import get_metric, get_fleet_metric, get_metric_history
 
 metric_bp = Blueprint('metric_bp', __name__)
 
@@ -11,7 +11,15 @@ def metric_host():
     data = request.form
     channel_id = data.get('channel_id')   # channel nơi user gõ command
     text = data.get('text', '').strip()
-    host_filter = text if text else None
+
+    # `/metric <host> --since 60m` → chế độ history
+    since = None
+    parts = text.split()
+    if "--since" in parts:
+        i = parts.index("--since")
+        since = parts[i + 1] if i + 1 < len(parts) else ""
+        parts = parts[:i] + parts[i + 2:]
+    host_filter = " ".join(parts) or None
 
     # 1) Chặn nếu user gõ ở channel khác
     if channel_id != ALLOWED_CHANNEL:
@@ -21,7 +29,13 @@ def metric_host():
         )
 
     # 2) Nếu đúng channel → chạy logic bình thường
-    msg = get_metric(host_filter)
+    #    `/metric all` → bảng tất cả host trong 1 query
+    if since is not None:
+        msg = get_metric_history(host_filter, since)
+    elif host_filter and host_filter.lower() == "all":
+        msg = get_fleet_metric()
+    else:
+        msg = get_metric(host_filter)
     client = current_app.config['SLACK_CLIENT']
 
     # Gửi đúng channel mà user gõ (chính là system-metrics)
@@ -0,0 +1,33 @@
+from flask import Blueprint, jsonify
+from app.services.job_executor import slash_jobs, format_job_metrics
+from app.services.waf.alert_pipeline import alert_jobs, stage_latency
+from app.slack.dedupe import event_deduper
+from app.services.elk.metric import metric_cache
+from app.services.elk.metric_watcher import metric_watcher
+from app.services.elk.kibana_api import kibana
+from app.services.waf.attachment_batcher import attachment_batcher
+from app.services.waf.case_reconciler import case_reconciler
+from app.services.waf.ip_lists import ip_lists
+
+stats_bp = Blueprint("stats_bp", __name__)
+
+
+@stats_bp.route("/bot-stats", methods=["POST"])
+def bot_stats():
+    sections = [
+        format_job_metrics(slash_jobs),
+        format_job_metrics(alert_jobs),
+        stage_latency.format("*⏱️ Alert pipeline stages*"),
+        event_deduper.format(),
+        metric_cache.format("*🗃️ Metric snapshot cache*"),
+        metric_watcher.format(),
+        kibana.format(),
+        attachment_batcher.format(),
+        case_reconciler.format(),
+        ip_lists.format(),
+    ]
+
+    return jsonify({
+        "response_type": "ephemeral",
+        "text": "\n\n".join(sections)
+    }), 200
@@ -1,33 +1,21 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 import json
-import os
 import re
-import threading
 import requests
 
 from app.services.ai.gpt_client import ask_gpt
+from app.services.job_executor import slash_jobs, busy_text, notify_queued
+from app.services.waf.alert_log_store import get_alert_log
 
 ai_exception_bp = Blueprint("ai_exception_bp", __name__)
 
-# =====================================================
-# CONFIG
-# =====================================================
-STORE_PATH = os.path.abspath(
-    os.path.join(os.path.dirname(__file__), "../../../data/alert_logs.json")
-)
+slash_jobs.register("ai_exception", priority=2, max_queue=10)
 
 # =====================================================
 # LOAD ALERT LOGS
 # =====================================================
-def load_logs():
-    try:
-        with open(STORE_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
-
 def get_alert(alert_id):
-    return load_logs().get(alert_id)
+    return get_alert_log(alert_id)
 
 # =====================================================
 # PREPROCESS ALERT (SAFE FOR AI)
@@ -249,12 +237,22 @@ def ai_exception():
             "text": "Usage: /ai-exception <AlertID>"
         }), 200
 
-    # ACK NGAY → KHÔNG TIMEOUT
-    threading.Thread(
-        target=background_ai_slash,
-        args=(alert_id, response_url),
-        daemon=True
-    ).start()
+    # ACK NGAY → KHÔNG TIMEOUT (job chạy trong pool chung, có giới hạn hàng đợi)
+    accepted, position = slash_jobs.submit(
+        "ai_exception", background_ai_slash, alert_id, response_url
+    )
+
+    if not accepted:
+        return jsonify({
+            "response_type": "ephemeral",
+            "text": busy_text("/ai-exception")
+        }), 200
+
+    notify_queued(
+        current_app.config["SLACK_CLIENT"],
+        request.form.get("channel_id"), request.form.get("user_id"),
+        position, f"/ai-exception {alert_id}"
+    )
 
     return jsonify({
         "response_type": "ephemeral",
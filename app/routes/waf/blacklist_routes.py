@@ -1,11 +1,18 @@
 from flask import Blueprint, request, Response, current_app
-from app.services.waf.blacklist_client import deny_ip
+from app.services.waf.blacklist_client import deny_ip, compact_blacklist, format_compaction
+from app.services.waf.ip_bulk import run_bulk_command
+from app.services.job_executor import slash_jobs, busy_text, notify_queued
+from app.utils.helpers import is_valid_ip
 
 denyblack_bp = Blueprint('denyblack_bp', __name__)
 
 # Channel duy nhất cho phép dùng lệnh /deny
 ALLOWED_CHANNEL = "C09RK60AE11"
 
+slash_jobs.register("deny_bulk", priority=1, max_queue=5)
+slash_jobs.register("compact_blacklist", priority=2, max_queue=1)
+
+
 @denyblack_bp.route('/deny', methods=['POST'])
 def add_ip_blacklist():
     data = request.form
@@ -25,12 +32,60 @@ def add_ip_blacklist():
     if not text:
         client.chat_postMessage(
             channel=channel_id,
-            text="❌ Sai cú pháp. Dùng: `/deny <ip>`"
+            text="❌ Sai cú pháp. Dùng: `/deny <ip> | <ip/cidr> <ip/cidr>,... | <file Slack>`"
+        )
+        return Response(), 200
+
+    # 3) Nhiều IP / CIDR / file → chạy nền, 1 message tổng kết
+    if not is_valid_ip(text):
+        accepted, position = slash_jobs.submit(
+            "deny_bulk", run_bulk_command,
+            client, "blacklist", channel_id, data.get('user_id'), text
         )
+        if not accepted:
+            client.chat_postMessage(
+                channel=channel_id,
+                text=busy_text("/deny")
+            )
+        else:
+            notify_queued(client, channel_id, data.get('user_id'), position, "/deny")
         return Response(), 200
 
-    # 3) Thực thi chặn IP
+    # 4) 1 IP → thực thi chặn IP ngay
     msg = deny_ip(text)
     client.chat_postMessage(channel=channel_id, text=msg)
 
     return Response(), 200
+
+
+def _compact_job(client, channel_id: str, dry_run: bool):
+    try:
+        msg = format_compaction(compact_blacklist(dry_run=dry_run))
+    except Exception as e:
+        msg = f"⚠️ Lỗi khi compact blacklist: {e}"
+    client.chat_postMessage(channel=channel_id, text=msg)
+
+
+@denyblack_bp.route('/compact-blacklist', methods=['POST'])
+def compact_blacklist_cmd():
+    data = request.form
+    channel_id = data.get('channel_id')
+    dry_run = data.get('text', '').strip() == "--dry-run"
+    client = current_app.config['SLACK_CLIENT']
+
+    if channel_id != ALLOWED_CHANNEL:
+        client.chat_postMessage(
+            channel=channel_id,
+            text="❌ Lệnh `/compact-blacklist` chỉ được dùng trong kênh #security-alerts."
+        )
+        return Response(), 200
+
+    accepted, position = slash_jobs.submit("compact_blacklist", _compact_job, client, channel_id, dry_run)
+    if not accepted:
+        client.chat_postMessage(
+            channel=channel_id,
+            text=":no_entry: Đang có 1 lần compact blacklist chạy, thử lại sau."
+        )
+    else:
+        notify_queued(client, channel_id, data.get('user_id'), position, "/compact-blacklist")
+    return Response(), 200
@@ -1,26 +1,143 @@
-from flask import Blueprint, request, jsonify
-from app.services.waf.case_store import get_case, update_status
-from app.services.elk.kibana_api import close_case_in_kibana
+import ipaddress
+import re
+from datetime import timedelta
+from flask import Blueprint, request, jsonify, current_app
+from app.services.waf.case_store import (
+    find_case, close_case as close_case_local, find_open_cases, close_cases
+)
+from app.services.elk.kibana_api import close_case_in_kibana, close_cases_in_kibana
+from app.services.job_executor import slash_jobs, busy_text, notify_queued
 
 close_case_bp = Blueprint("close_case_bp", __name__)
 
+slash_jobs.register("close_case_bulk", priority=1, max_queue=5)
+
+USAGE = (
+    "⚠️ Cú pháp đúng:\n"
+    "`/close-case <case_id>`\n"
+    "`/close-case --ip <ip|cidr>` | `--older-than 2h` | `--all-fp` (có thể kết hợp)"
+)
+
+_DURATION_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def _parse_duration(text: str):
+    m = re.fullmatch(r"(\d+)([mhd])", (text or "").strip().lower())
+    if not m:
+        return None
+    return timedelta(**{_DURATION_UNITS[m.group(2)]: int(m.group(1))})
+
+
+def _parse_filters(tokens: list):
+    """--ip <cidr> / --older-than <dur> / --all-fp → dict filter, None nếu sai cú pháp."""
+    filters = {}
+    i = 0
+    while i < len(tokens):
+        flag = tokens[i]
+        if flag == "--all-fp":
+            filters["all_fp"] = True
+            i += 1
+            continue
+        if flag not in ("--ip", "--older-than") or i + 1 >= len(tokens):
+            return None
+        value = tokens[i + 1]
+        if flag == "--ip":
+            filters["cidr"] = value
+        else:
+            filters["older_than"] = _parse_duration(value)
+            if filters["older_than"] is None:
+                return None
+        i += 2
+    return filters
+
+
+def _close_bulk(slack_client, channel_id: str, user_id: str, filters: dict, label: str):
+    cases = find_open_cases(**filters)
+    if not cases:
+        slack_client.chat_postMessage(
+            channel=channel_id,
+            text=f"ℹ️ Không có case đang mở nào khớp `{label}`."
+        )
+        return
+
+    case_ids = [c["case_id"] for c in cases]
+    kibana_closed, kibana_missing, kibana_failed = close_cases_in_kibana(case_ids)
+
+    # Case không còn trên Kibana cũng đóng local để hết "treo";
+    # case của lô lỗi giữ nguyên open để chạy lại lệnh
+    closed = close_cases(kibana_closed + kibana_missing)
+
+    ips = sorted({c["ip"] for c in closed})
+    msg = (
+        f"✔️ <@{user_id}> đã đóng `{len(closed)}` case (`{label}`) "
+        f"cho {len(ips)} IP: {', '.join(f'`{ip}`' for ip in ips[:20])}"
+        f"{' …' if len(ips) > 20 else ''}"
+    )
+    if kibana_missing:
+        msg += f"\nℹ️ `{len(kibana_missing)}` case không còn trên Kibana, chỉ đóng local."
+    if kibana_failed:
+        first = next(iter(kibana_failed.values()))
+        msg += (
+            f"\n⚠️ `{len(kibana_failed)}` case lỗi Kibana API, vẫn đang mở "
+            f"(chạy lại lệnh để thử tiếp):\n`{first}`"
+        )
+    slack_client.chat_postMessage(channel=channel_id, text=msg)
+
 
 @close_case_bp.route("/close-case", methods=["POST"])
 def close_case():
-    case_id = request.form.get("text", "").strip()
-    if not case_id:
+    text = request.form.get("text", "").strip()
+    if not text:
+        return jsonify({
+            "response_type": "ephemeral",
+            "text": USAGE
+        }), 200
+
+    tokens = text.split()
+    if tokens[0].startswith("--"):
+        filters = _parse_filters(tokens)
+        if not filters:
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": USAGE
+            }), 200
+
+        if "cidr" in filters:
+            try:
+                ipaddress.ip_network(filters["cidr"], strict=False)
+            except ValueError:
+                return jsonify({
+                    "response_type": "ephemeral",
+                    "text": f"❌ `{filters['cidr']}` không phải IP/CIDR hợp lệ."
+                }), 200
+
+        accepted, position = slash_jobs.submit(
+            "close_case_bulk", _close_bulk,
+            current_app.config['SLACK_CLIENT'],
+            request.form.get("channel_id"),
+            request.form.get("user_id"),
+            filters, text
+        )
+        if not accepted:
+            return jsonify({
+                "response_type": "ephemeral",
+                "text": busy_text("/close-case")
+            }), 200
+
+        notify_queued(
+            current_app.config['SLACK_CLIENT'],
+            request.form.get("channel_id"), request.form.get("user_id"),
+            position, f"/close-case {text}"
+        )
+
         return jsonify({
             "response_type": "ephemeral",
-            "text": "⚠️ Cú pháp đúng:\n`/close-case <case_id>`"
+            "text": f"⏳ Đang đóng các case khớp `{text}`..."
         }), 200
 
-    from app.services.waf.case_store import _CASES
-    target_ip = None
-    for ip, cases in _CASES.items():
-        for c in cases:
-            if isinstance(c, dict) and c.get("case_id") == case_id:
-                target_ip = ip
-                break
+    case_id = tokens[0]
+    case = find_case(case_id)
+    target_ip = case["ip"] if case else None
 
     if not target_ip:
         return jsonify({
@@ -36,7 +153,7 @@ def close_case():
             "text": f"⚠️ Lỗi Kibana API:\n`{str(e)}`"
         }), 200
 
-    update_status(target_ip, "closed")
+    close_case_local(case_id)
 
     return jsonify({
         "response_type": "ephemeral",
@@ -1,9 +1,7 @@
 from flask import Blueprint, request, jsonify
-import random
 import re
-from datetime import datetime
-# Giả định: apply_exception_rule là API client để triển khai quy tắc
-from app.services.waf.exception_rule_client import apply_exception_rule 
+# Registry: cấp Rule ID tăng dần theo dải PP1 + bỏ qua rule trùng (không reload WAF)
+from app.services.waf.exception_registry import apply_rule, format_duplicate
 
 # --- Định nghĩa Blueprint (Giữ tên PP1 theo yêu cầu) ---
 exception_pp1_bp = Blueprint("exception_pp1_bp", __name__) 
@@ -195,8 +193,6 @@ def exception_pp1():
     # Xác định loại loại trừ đang được sử dụng
     is_target_specific = bool(target)  # True nếu PP1 (có target), False nếu PP2 (toàn cục có điều kiện)
 
-    # Sử dụng ID ngẫu nhiên, đảm bảo không trùng lặp nếu chạy nhiều lần
-    new_id = random.randint(100000, 199999)
     ctl_lines = []
 
     # Xây dựng lệnh ctl dựa trên loại loại trừ
@@ -218,28 +214,35 @@ def exception_pp1():
                 # Ví dụ: ctl:ruleRemoveByTag=attack-sqli
                 ctl_lines.append(f"ctl:ruleRemoveByTag={token}")
 
-    actions = [
-        f"id:{new_id}",
-        f"phase:{phase}",
-        "pass",
-        "nolog",
-        *ctl_lines
-    ]
-    action_block = ",".join(actions)
-
-    # Tạo Rule: dùng escaped_match_string đã được sanitize
-    rule = (
-        f'SecRule {variable} "{operator} {escaped_match_string}" \\\n'
-        f'"{action_block}"'
-    )
+    # Rule ID do registry cấp (tăng dần trong dải PP1, không trùng)
+    def build_rule(new_id):
+        actions = [
+            f"id:{new_id}",
+            f"phase:{phase}",
+            "pass",
+            "nolog",
+            *ctl_lines
+        ]
+        action_block = ",".join(actions)
+
+        # Tạo Rule: dùng escaped_match_string đã được sanitize
+        return (
+            f'SecRule {variable} "{operator} {escaped_match_string}" \\\n'
+            f'"{action_block}"'
+        )
 
-    # --- 4. Triển khai Rule ---
-    success, ts, stage, err_msg = apply_exception_rule(rule)
+    # --- 4. Triển khai Rule (rule trùng → không reload WAF) ---
+    result = apply_rule("pp1", build_rule)
+    rule = result["rule"]
+    success, ts, stage, err_msg = result["success"], result["ts"], result["stage"], result["err_msg"]
 
     # --- 5. Trả về Slack Response ---
     method_used = "PP1 (Target Specific)" if is_target_specific else "PP2 (Conditional Global)"
 
-    if success:
+    if result["duplicate"]:
+        header = format_duplicate(method_used, result)
+        err_block = ""
+    elif success:
         header = (
             f":white_check_mark: **{method_used} applied successfully**\n"
             f"- Time: `{ts}`\n"
@@ -1,9 +1,7 @@
 from flask import Blueprint, request, jsonify
-import random
 import re
-from datetime import datetime
-# Giả định: apply_exception_rule là API client để triển khai quy tắc
-from app.services.waf.exception_rule_client import apply_exception_rule 
+# Registry: cấp Rule ID tăng dần theo dải PP3 + bỏ qua rule trùng (không reload WAF)
+from app.services.waf.exception_registry import apply_rule, format_duplicate
 
 # --- Định nghĩa Blueprint ---
 exception_pp3_bp = Blueprint("exception_pp3_bp", __name__)
@@ -107,35 +105,39 @@ def exception_pp3():
 
     # --- 3. Logic tạo Rule ModSecurity ---
     
-    # Generate random Rule ID
-    new_id = random.randint(900000, 999999)
-
-    # PP3 Logic: Tắt toàn bộ Rule Engine khi match
-    actions = [
-        f"id:{new_id}",
-        f"phase:{phase}",
-        "pass",
-        "nolog",
-        "ctl:ruleEngine=Off" # Lệnh cốt lõi của PP3
-    ]
-
-    action_block = ",".join(actions)
-
-    rule = (
-        f'SecRule {variable} "{operator} {match_string}" \\\n'
-        f'"{action_block}"'
-    )
+    # Rule ID do registry cấp (tăng dần trong dải PP3, không trùng)
+    def build_rule(new_id):
+        # PP3 Logic: Tắt toàn bộ Rule Engine khi match
+        actions = [
+            f"id:{new_id}",
+            f"phase:{phase}",
+            "pass",
+            "nolog",
+            "ctl:ruleEngine=Off" # Lệnh cốt lõi của PP3
+        ]
+
+        action_block = ",".join(actions)
+
+        return (
+            f'SecRule {variable} "{operator} {match_string}" \\\n'
+            f'"{action_block}"'
+        )
 
     # --- 4. Triển khai Rule ---
     
-    # Gọi service client để triển khai rule lên WAF (Giả định hàm này tồn tại)
-    success, ts, stage, err_msg = apply_exception_rule(rule)
+    # Gọi registry: rule trùng → trả kết quả cũ, không reload WAF
+    result = apply_rule("pp3", build_rule)
+    rule = result["rule"]
+    success, ts, stage, err_msg = result["success"], result["ts"], result["stage"], result["err_msg"]
 
     # --- 5. Trả về Slack Response ---
     
     method_used = "PP3 (Conditional Rule Engine Off)"
 
-    if success:
+    if result["duplicate"]:
+        header = format_duplicate(method_used, result)
+        err_block = ""
+    elif success:
         header = (
             f":white_check_mark: **{method_used} applied successfully**\n"
             f"- Time: `{ts}`\n"
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from app.services.waf.exception_rule_client import apply_exception_rule
+from app.services.waf.exception_registry import apply_rule, format_duplicate
 import re
 
 # Định nghĩa Blueprint
@@ -88,9 +88,14 @@ def exception_pp4():
     rule = "\n".join(rule_lines)
 
     # Áp dụng API WAF
-    success, ts, stage, err_msg = apply_exception_rule(rule)
+    # Qua registry: directive trùng đã áp dụng → không reload WAF
+    result = apply_rule("pp4", rule)
+    success, ts, stage, err_msg = result["success"], result["ts"], result["stage"], result["err_msg"]
 
-    if success:
+    if result["duplicate"]:
+        header = format_duplicate(method_used, result)
+        err_block = ""
+    elif success:
         header = (
             f":white_check_mark: **{method_used} applied successfully**\n"
             f"- Time: `{ts}`\n"
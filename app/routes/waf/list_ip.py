@@ -21,19 +21,22 @@ def list_ip():
         )
         return Response(), 200
 
-    # 2) Kiểm tra cú pháp: chỉ chấp nhận ip_whitelist hoặc ip_blacklist
-    if text not in ["ip_whitelist", "ip_blacklist"]:
+    # 2) Kiểm tra cú pháp: ip_whitelist hoặc ip_blacklist, kèm số trang (tuỳ chọn)
+    parts = text.split()
+    if (not parts or parts[0] not in ["ip_whitelist", "ip_blacklist"]
+            or len(parts) > 2 or (len(parts) == 2 and not parts[1].isdigit())):
         client.chat_postMessage(
             channel=channel_id,
-            text="❌ Sai cú pháp. Dùng: `/list ip_whitelist` hoặc `/list ip_blacklist`"
+            text="❌ Sai cú pháp. Dùng: `/list ip_whitelist [trang]` hoặc `/list ip_blacklist [trang]`"
         )
         return Response(), 200
 
-    # 3) Xác định mode
-    mode = "whitelist" if "whitelist" in text else "blacklist"
+    # 3) Xác định mode + trang
+    mode = "whitelist" if "whitelist" in parts[0] else "blacklist"
+    page = int(parts[1]) if len(parts) == 2 else 1
 
-    # 4) Gọi hàm lấy danh sách IP
-    msg = list_ips(mode)
+    # 4) Lấy danh sách IP (mirror local, không gọi WAF mỗi lần)
+    msg = list_ips(mode, page)
 
     # 5) Trả kết quả
     client.chat_postMessage(channel=channel_id, text=msg)
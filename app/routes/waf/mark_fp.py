@@ -1,10 +1,8 @@
 from flask import Blueprint, request, jsonify
 import re
-from datetime import datetime
 
-from app.services.waf.alert_log_store import save_alert_log
-from app.services.waf.case_store import _CASES, _save as save_cases
-from app.services.waf.case_store import update_status
+from app.services.waf.alert_log_store import update_alert_log
+from app.services.waf.case_store import detach_alert
 from app.services.elk.kibana_api import close_case_in_kibana
 
 mark_fp_bp = Blueprint("mark_fp_bp", __name__)
@@ -22,53 +20,28 @@ def mark_fp():
         }), 200
 
     # 1️⃣ Đánh dấu alert là FP trong alert_logs.json
-    from app.services.waf.alert_log_store import _LOGS
+    def _mark_fp(alert_data):
+        if alert_data:
+            alert_data["status"] = "FP"
+        return alert_data
 
-    alert_data = _LOGS.get(alert_id)
-    if not alert_data:
+    if not update_alert_log(alert_id, _mark_fp):
         return jsonify({
             "response_type": "ephemeral",
             "text": f"❌ Không tìm thấy alert `{alert_id}` trong alert_logs.json"
         }), 200
 
-    alert_data["status"] = "FP"
-    save_alert_log(alert_id, alert_data)
+    # 2️⃣ Gỡ alert khỏi case OPEN (1 transaction, tra theo index alert_id)
+    #    Case chỉ có 1 alert → remove + close case
+    removed_from_cases, closed_case_ids = detach_alert(alert_id)
 
-    # 2️⃣ Gỡ alert khỏi case OPEN
-    removed_from_cases = 0
-    auto_closed_cases = 0
+    for case_id in closed_case_ids:
+        try:
+            close_case_in_kibana(case_id)
+        except Exception:
+            pass  # không block flow nếu Kibana lỗi
 
-    for ip, cases in _CASES.items():
-        if not isinstance(cases, list):
-            continue
-
-        for case in cases:
-            if case.get("status") != "open":
-                continue
-
-            alerts = case.get("alerts", [])
-            if alert_id not in alerts:
-                continue
-
-            # 🔥 Case chỉ có 1 alert → remove + close case
-            if len(alerts) == 1:
-                try:
-                    close_case_in_kibana(case["case_id"])
-                except Exception:
-                    pass  # không block flow nếu Kibana lỗi
-
-                case["alerts"] = []
-                case["status"] = "closed"
-                case["closed_at"] = datetime.utcnow().isoformat()
-
-                auto_closed_cases += 1
-            else:
-                # Case nhiều alert → chỉ remove alert FP
-                case["alerts"] = [a for a in alerts if a != alert_id]
-
-            removed_from_cases += 1
-
-    save_cases()
+    auto_closed_cases = len(closed_case_ids)
 
     # 3️⃣ Trả kết quả Slack
     msg = (
@@ -1,6 +1,3 @@
-import threading
-import json
-import os
 from flask import Blueprint, request, jsonify, current_app
 
 from app.services.waf.alert_handler import build_ai_message
@@ -13,18 +10,23 @@ from app.services.elk.query_top_anomaly import (
 
 # ❗ DÙNG CHO report-AI
 from app.services.waf.alert_log_reader import get_logs_by_alert_id
+from app.services.waf.alert_log_store import update_alert_log
 from app.services.ai.gpt_waf_analyzer import analyze_waf_with_gpt
+from app.services.job_executor import slash_jobs, busy_text, notify_queued
 
 
 report_bp = Blueprint("report_bp", __name__)
 
-# ===========================================================
-#  PATH CONFIG
-# ===========================================================
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-BOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "../../../"))
-DATA_DIR = os.path.join(BOT_DIR, "data")
-ALERT_LOG_PATH = os.path.join(DATA_DIR, "alert_logs.json")
+# report-no-AI chỉ query ES → ưu tiên hơn report-AI (gọi OpenAI)
+slash_jobs.register("report_no_ai", priority=1, max_queue=20)
+slash_jobs.register("report_ai", priority=2, max_queue=10)
+
+
+def _busy_response(command: str):
+    return jsonify({
+        "response_type": "ephemeral",
+        "text": busy_text(command)
+    }), 200
 
 
 # ===========================================================
@@ -117,6 +119,9 @@ def report_no_ai():
             "text": "Usage: `/report-no-AI <IP>`"
         }), 200
 
+    if not slash_jobs.has_capacity("report_no_ai"):
+        return _busy_response("/report-no-AI")
+
     slack_client = current_app.config["SLACK_CLIENT"]
 
     parent = slack_client.chat_postMessage(
@@ -125,11 +130,14 @@ def report_no_ai():
     )
     parent_ts = parent["ts"]
 
-    threading.Thread(
-        target=_worker,
-        args=(slack_client, ip, channel_id, parent_ts),
-        daemon=True
-    ).start()
+    accepted, position = slash_jobs.submit(
+        "report_no_ai", _worker, slack_client, ip, channel_id, parent_ts
+    )
+    if not accepted:
+        return _busy_response("/report-no-AI")
+    notify_queued(
+        slack_client, channel_id, request.form.get("user_id"), position, "/report-no-AI", thread_ts=parent_ts
+    )
 
     return "", 200
 
@@ -138,7 +146,7 @@ def report_no_ai():
 #  /report-AI <ALERT_ID>
 #  ✅ AI phân tích
 #  ✅ GIỮ request false_positive
-#  ❌ XOÁ request còn lại khỏi alert_logs.json
+#  ❌ XOÁ request còn lại khỏi alert log store
 # ===========================================================
 @report_bp.route("/report-AI", methods=["POST"])
 def report_ai():
@@ -165,6 +173,9 @@ def report_ai():
             "text": f"No logs found for alert `{alert_id}`"
         }), 200
 
+    if not slash_jobs.has_capacity("report_ai"):
+        return _busy_response("/report-AI")
+
     slack_client = current_app.config["SLACK_CLIENT"]
 
     parent = slack_client.chat_postMessage(
@@ -200,30 +211,25 @@ def report_ai():
         if not fp_request_ids:
             return
 
-        if not os.path.exists(ALERT_LOG_PATH):
-            return
-
-        # 3️⃣ Load alert_logs.json
-        with open(ALERT_LOG_PATH, "r", encoding="utf-8") as f:
-            store = json.load(f)
-
-        alert = store.get(alert_id)
-        if not alert:
-            return
-
-        # 4️⃣ GIỮ LẠI request false_positive
-        alert["requests"] = [
-            r for r in alert.get("requests", [])
-            if r.get("request_id") in fp_request_ids
-        ]
-
-        # 5️⃣ Nếu không còn request → xoá alert
-        if not alert["requests"]:
-            store.pop(alert_id, None)
-
-        # 6️⃣ Ghi lại file
-        with open(ALERT_LOG_PATH, "w", encoding="utf-8") as f:
-            json.dump(store, f, indent=2, ensure_ascii=False)
+        # 3️⃣ GIỮ LẠI request false_positive (update trong 1 lock, không
+        #    đọc/ghi lại toàn bộ file)
+        def _keep_fp(alert):
+            if not alert:
+                return None
+            alert["requests"] = [
+                r for r in alert.get("requests", [])
+                if r.get("request_id") in fp_request_ids
+            ]
+            # 4️⃣ Nếu không còn request → xoá alert
+            return alert if alert["requests"] else None
+
+        update_alert_log(alert_id, _keep_fp)
+
+    accepted, position = slash_jobs.submit("report_ai", ai_and_cleanup)
+    if not accepted:
+        return _busy_response("/report-AI")
+    notify_queued(
+        slack_client, channel_id, request.form.get("user_id"), position, "/report-AI", thread_ts=parent_ts
+    )
 
-    threading.Thread(target=ai_and_cleanup, daemon=True).start()
     return "", 200
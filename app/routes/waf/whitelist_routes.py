@@ -1,11 +1,17 @@
 from flask import Blueprint, request, Response, current_app
 from app.services.waf.whitelist_client import allow_ip
+from app.services.waf.ip_bulk import run_bulk_command
+from app.services.job_executor import slash_jobs, busy_text, notify_queued
+from app.utils.helpers import is_valid_ip
 
 allowwhite_bp = Blueprint('allowwhite_bp', __name__)
 
 # Channel duy nhất cho phép dùng lệnh /allow
 ALLOWED_CHANNEL = "C09RK60AE11"
 
+slash_jobs.register("allow_bulk", priority=1, max_queue=5)
+
+
 @allowwhite_bp.route('/allow', methods=['POST'])
 def add_ip_whitelist():
     data = request.form
@@ -25,14 +31,29 @@ def add_ip_whitelist():
     if not text:
         client.chat_postMessage(
             channel=channel_id,
-            text="❌ Sai cú pháp. Dùng cú pháp: `/allow <ip>`"
+            text="❌ Sai cú pháp. Dùng cú pháp: `/allow <ip> | <ip/cidr> <ip/cidr>,... | <file Slack>`"
+        )
+        return Response(), 200
+
+    # 3) Nhiều IP / CIDR / file → chạy nền, 1 message tổng kết
+    if not is_valid_ip(text):
+        accepted, position = slash_jobs.submit(
+            "allow_bulk", run_bulk_command,
+            client, "whitelist", channel_id, data.get('user_id'), text
         )
+        if not accepted:
+            client.chat_postMessage(
+                channel=channel_id,
+                text=busy_text("/allow")
+            )
+        else:
+            notify_queued(client, channel_id, data.get('user_id'), position, "/allow")
         return Response(), 200
 
-    # 3) Xử lý thêm IP vào whitelist
+    # 4) 1 IP → xử lý thêm IP vào whitelist
     msg = allow_ip(text)
 
-    # 4) Gửi kết quả
+    # 5) Gửi kết quả
     client.chat_postMessage(channel=channel_id, text=msg)
 
     return Response(), 200
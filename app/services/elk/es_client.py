@@ -0,0 +1,50 @@
+import os
+import threading
+from elasticsearch import Elasticsearch
+
+# ===========================================================
+#  ES CLIENT DÙNG CHUNG CHO MỌI SERVICE ELK
+#  Tạo lazy 1 lần / process (không block lúc khởi động), giữ connection
+#  pool + TLS session thay vì tạo client mới cho mỗi query.
+# ===========================================================
+ES_URL = os.getenv("ES_URL", "https://192.168.10.140:9200")
+ES_USER = os.getenv("ES_USER", "elastic")
+ES_PASSWORD = os.getenv("ES_PASSWORD", "elastic")
+
+ES_POOL_SIZE = int(os.getenv("ES_POOL_SIZE", "10"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "10"))
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "2"))
+ES_RETRY_ON_TIMEOUT = os.getenv("ES_RETRY_ON_TIMEOUT", "1") == "1"
+ES_SNIFF = os.getenv("ES_SNIFF", "0") == "1"
+ES_HTTP_COMPRESS = os.getenv("ES_HTTP_COMPRESS", "1") == "1"
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def _build_client() -> Elasticsearch:
+    return Elasticsearch(
+        [ES_URL],
+        basic_auth=(ES_USER, ES_PASSWORD),
+        verify_certs=False,
+        connections_per_node=ES_POOL_SIZE,
+        request_timeout=ES_REQUEST_TIMEOUT,
+        max_retries=ES_MAX_RETRIES,
+        retry_on_timeout=ES_RETRY_ON_TIMEOUT,
+        # Không sniff lúc start để không block khởi động
+        sniff_on_start=False,
+        sniff_on_node_failure=ES_SNIFF,
+        http_compress=ES_HTTP_COMPRESS,
+    )
+
+
+def get_es_client(name: str = "default") -> Elasticsearch:
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _build_client()
+            _clients[name] = client
+        return client
@@ -1,9 +1,221 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
 import requests
+from requests.adapters import HTTPAdapter
+from app.utils.latency import LatencyRecorder
 
-KIBANA_URL = "http://192.168.10.140:5601"
-AUTH = ("elastic", "elastic")
+KIBANA_URL = os.getenv("KIBANA_URL", "http://192.168.10.140:5601")
+AUTH = (os.getenv("KIBANA_USER", "elastic"), os.getenv("KIBANA_PASSWORD", "elastic"))
 HEADERS = {"Content-Type": "application/json", "kbn-xsrf": "true"}
 
+KIBANA_POOL_SIZE = int(os.getenv("KIBANA_POOL_SIZE", "10"))
+KIBANA_CONNECT_TIMEOUT = float(os.getenv("KIBANA_CONNECT_TIMEOUT", "3"))
+KIBANA_READ_TIMEOUT = float(os.getenv("KIBANA_READ_TIMEOUT", "10"))
+KIBANA_MAX_RETRIES = int(os.getenv("KIBANA_MAX_RETRIES", "3"))
+KIBANA_BACKOFF = float(os.getenv("KIBANA_BACKOFF", "0.5"))
+KIBANA_BREAKER_THRESHOLD = int(os.getenv("KIBANA_BREAKER_THRESHOLD", "5"))
+KIBANA_BREAKER_RESET = float(os.getenv("KIBANA_BREAKER_RESET", "30"))
+
+# Lỗi tạm thời → retry. 409 (conflict version / ghi đồng thời lên case) chỉ retry khi caller cho phép
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+# POST không idempotent (vd. tạo case): chỉ retry khi chắc chắn Kibana chưa xử lý
+SAFE_POST_STATUS = {429, 503}
+
+
+class KibanaUnavailable(Exception):
+    """Circuit breaker đang mở: Kibana lỗi liên tục, fail nhanh thay vì chờ timeout."""
+
+
+class CircuitBreaker:
+    """
+    closed → open sau `threshold` lần lỗi liên tiếp; sau `reset_timeout` giây
+    cho 1 request thử (half-open): thành công thì đóng lại, lỗi thì mở tiếp.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                if self._opened_at is None or self._probing:
+                    self.trips += 1
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class KibanaClient:
+    def __init__(self, base_url: str = KIBANA_URL, auth=AUTH):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers.update(HEADERS)
+        self.session.verify = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=KIBANA_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.timeout = (KIBANA_CONNECT_TIMEOUT, KIBANA_READ_TIMEOUT)
+        self.max_retries = KIBANA_MAX_RETRIES
+        self.breaker = CircuitBreaker(KIBANA_BREAKER_THRESHOLD, KIBANA_BREAKER_RESET)
+        self.latency = LatencyRecorder()
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    def _backoff(self, attempt: int):
+        time.sleep(KIBANA_BACKOFF * (2 ** attempt) * (1 + random.random() * 0.25))
+
+    def request(self, method: str, path: str, endpoint: str, retry_on=(), **kwargs):
+        """
+        Gọi Kibana qua session dùng chung (keep-alive), có timeout,
+        retry backoff lũy thừa cho lỗi tạm thời và circuit breaker.
+        endpoint: tên dùng cho latency metric.
+        retry_on: status code retry thêm ngoài lỗi tạm thời (vd. {409}).
+        Trả về Response đã raise_for_status.
+        """
+        if not self.breaker.allow():
+            raise KibanaUnavailable(f"Kibana circuit open, bỏ qua {endpoint}")
+
+        idempotent = method.upper() != "POST"
+        retry_status = (TRANSIENT_STATUS if idempotent else SAFE_POST_STATUS) | set(retry_on)
+
+        # Mọi lối ra không thành công (kể cả exception lạ: ChunkedEncodingError,
+        # TooManyRedirects, ...) đều phải báo breaker, nếu không probe half-open kẹt mãi
+        done = False
+        try:
+            with self.latency.timer(endpoint):
+                attempt = 0
+                while True:
+                    try:
+                        r = self.session.request(
+                            method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs
+                        )
+                    except (requests.ConnectionError, requests.Timeout) as e:
+                        # Read timeout của POST: Kibana có thể đã tạo xong → không gửi lại
+                        can_retry = idempotent or isinstance(e, requests.ConnectTimeout)
+                        if not can_retry or attempt >= self.max_retries:
+                            raise
+                    else:
+                        if r.status_code not in retry_status or attempt >= self.max_retries:
+                            if r.status_code < 500:
+                                self.breaker.success()
+                                done = True
+                            r.raise_for_status()
+                            return r
+
+                    with self._lock:
+                        self.retries += 1
+                    self._backoff(attempt)
+                    attempt += 1
+        except BaseException:
+            if not done:
+                self.breaker.failure()
+            raise
+
+    def format(self) -> str:
+        return (
+            self.latency.format(
+                f"*🗂️ Kibana API* — circuit {self.breaker.state} "
+                f"(trips {self.breaker.trips}) | retries {self.retries}"
+            )
+            + "\n" + case_versions.format()
+        )
+
+
+class CaseVersionCache:
+    """
+    case_id → version gần nhất thấy trong response create/attach/patch/get.
+    PATCH dùng luôn version cache; sai (409) thì caller lấy lại rồi thử tiếp.
+    """
+
+    def __init__(self, max_keys: int = 5000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._versions = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "conflicts": 0}
+
+    def get(self, case_id: str):
+        with self._lock:
+            version = self._versions.get(case_id)
+            self.counters["hits" if version else "misses"] += 1
+            return version
+
+    def set(self, case_id: str, version: str):
+        if not case_id or not version:
+            return
+        with self._lock:
+            self._versions[case_id] = version
+            self._versions.move_to_end(case_id)
+            while len(self._versions) > self.max_keys:
+                self._versions.popitem(last=False)
+
+    def remember(self, payload):
+        """Nhận 1 case hoặc list case từ response Kibana, lưu lại version."""
+        cases = payload if isinstance(payload, list) else [payload]
+        for c in cases:
+            if isinstance(c, dict):
+                self.set(c.get("id"), c.get("version"))
+
+    def conflict(self, case_id: str):
+        with self._lock:
+            self._versions.pop(case_id, None)
+            self.counters["conflicts"] += 1
+
+    def format(self) -> str:
+        with self._lock:
+            c = dict(self.counters)
+            size = len(self._versions)
+        return (
+            f"> case version cache: hits {c['hits']} | misses {c['misses']} | "
+            f"409 conflicts {c['conflicts']} | entries {size}"
+        )
+
+
+kibana = KibanaClient()
+case_versions = CaseVersionCache()
+
+
+def _json(r):
+    try:
+        return r.json()
+    except ValueError:
+        return None
+
+
 def create_case(ip: str) -> str:
     body = {
         "title": f"WAF Case - {ip}",
@@ -19,19 +231,15 @@ def create_case(ip: str) -> str:
         }
     }
 
-    r = requests.post(
-        f"{KIBANA_URL}/api/cases",
-        json=body,
-        headers=HEADERS,
-        auth=AUTH,
-        verify=False
-    )
-    r.raise_for_status()
+    r = kibana.request("POST", "/api/cases", "create_case", json=body)
+    case = r.json()
+    case_versions.remember(case)
 
-    return r.json().get("id")
+    return case.get("id")
 
 
-def attach_alert(case_id: str, alert_id: str):
+def attach_alerts(case_id: str, alert_ids: list):
+    """Gắn nhiều alert vào case trong 1 lần _bulk_create."""
     body = [
         {
             "type": "alert",
@@ -43,55 +251,150 @@ def attach_alert(case_id: str, alert_id: str):
                 "name": "WAF Security Detect Attack"
             }
         }
+        for alert_id in alert_ids
     ]
 
-    r = requests.post(
-        f"{KIBANA_URL}/internal/cases/{case_id}/attachments/_bulk_create",
-        json=body,
-        headers=HEADERS,
-        auth=AUTH,
-        verify=False
+    # 409: case đang bị ghi đồng thời (version đổi) → thử lại
+    r = kibana.request(
+        "POST", f"/internal/cases/{case_id}/attachments/_bulk_create", "attach_alert",
+        retry_on={409}, json=body
     )
-    r.raise_for_status()
+    # Response là case sau khi gắn alert → version mới
+    case_versions.remember(_json(r))
+
+
+def attach_alert(case_id: str, alert_id: str):
+    attach_alerts(case_id, [alert_id])
 
 def get_case_version(case_id: str) -> str:
     """
     Lấy version của case từ Kibana.
     Version là bắt buộc khi PATCH case.
     """
-    r = requests.get(
-        f"{KIBANA_URL}/api/cases/{case_id}",
-        headers=HEADERS,
-        auth=AUTH,
-        verify=False
-    )
-    r.raise_for_status()
-    return r.json().get("version")
+    r = kibana.request("GET", f"/api/cases/{case_id}", "get_case")
+    version = r.json().get("version")
+    case_versions.set(case_id, version)
+    return version
 
 
 def close_case_in_kibana(case_id: str):
     """
     Đổi trạng thái case sang closed trên Kibana theo đúng format mới.
+    PATCH thẳng bằng version cache; chỉ GET lại version khi chưa có hoặc bị 409.
     """
-    version = get_case_version(case_id)
+    version = case_versions.get(case_id) or get_case_version(case_id)
+    attempt = 0
+    while True:
+        body = {
+            "cases": [
+                {
+                    "id": case_id,
+                    "status": "closed",
+                    "version": version
+                }
+            ]
+        }
+
+        try:
+            r = kibana.request("PATCH", "/api/cases", "patch_cases", json=body)
+            case_versions.remember(_json(r))
+            return True
+        except requests.HTTPError as e:
+            # 409: version cũ (case vừa được cập nhật) → lấy version mới rồi PATCH lại
+            if e.response is None or e.response.status_code != 409 or attempt >= kibana.max_retries:
+                raise
+            case_versions.conflict(case_id)
+            version = get_case_version(case_id)
+            attempt += 1
+
+
+# Kibana giới hạn số case trong 1 lần bulk PATCH
+BULK_PATCH_MAX = 100
 
-    body = {
-        "cases": [
-            {
-                "id": case_id,
-                "status": "closed",
-                "version": version
-            }
-        ]
-    }
 
-    r = requests.patch(
-        f"{KIBANA_URL}/api/cases",
-        json=body,
-        headers=HEADERS,
-        auth=AUTH,
-        verify=False
+def bulk_get_versions(case_ids: list) -> dict:
+    """
+    Lấy version của nhiều case trong 1 request (/internal/cases/_bulk_get).
+    Trả về {case_id: version}; case không tồn tại trên Kibana bị bỏ qua.
+    """
+    if not case_ids:
+        return {}
+    r = kibana.request(
+        "POST", "/internal/cases/_bulk_get", "bulk_get_cases",
+        retry_on=TRANSIENT_STATUS, json={"ids": list(case_ids)}
     )
-    r.raise_for_status()
+    cases = (_json(r) or {}).get("cases", [])
+    case_versions.remember(cases)
+    return {c["id"]: c.get("version") for c in cases if c.get("id")}
+
+
+def _close_chunk(chunk: list):
+    """PATCH đóng 1 lô case. Trả về list case_id đã đóng (case không có trên Kibana bị bỏ)."""
+    versions = {cid: case_versions.get(cid) for cid in chunk}
+    unknown = [cid for cid, v in versions.items() if not v]
+    if unknown:
+        versions.update(bulk_get_versions(unknown))
+
+    attempt = 0
+    while True:
+        targets = [cid for cid in chunk if versions.get(cid)]
+        if not targets:
+            return []
+        body = {
+            "cases": [
+                {"id": cid, "status": "closed", "version": versions[cid]}
+                for cid in targets
+            ]
+        }
+        try:
+            r = kibana.request("PATCH", "/api/cases", "patch_cases", json=body)
+            case_versions.remember(_json(r))
+            return targets
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 409 or attempt >= kibana.max_retries:
+                raise
+            for cid in targets:
+                case_versions.conflict(cid)
+            versions = bulk_get_versions(targets)
+            attempt += 1
+
+
+def close_cases_in_kibana(case_ids: list):
+    """
+    Đóng nhiều case bằng PATCH /api/cases (mỗi lần tối đa BULK_PATCH_MAX case).
+    Version lấy từ cache, thiếu thì _bulk_get; bị 409 thì _bulk_get lại cả lô rồi PATCH tiếp.
+    Lô lỗi không làm mất kết quả các lô trước: case của lô đó vào `failed`.
+    Trả về (list case_id đã đóng, list case_id không có trên Kibana, {case_id: lỗi}).
+    """
+    closed, missing, failed = [], [], {}
+    for start in range(0, len(case_ids), BULK_PATCH_MAX):
+        chunk = list(dict.fromkeys(case_ids[start:start + BULK_PATCH_MAX]))
+        try:
+            targets = _close_chunk(chunk)
+        except Exception as e:
+            print(f"[Kibana] Đóng {len(chunk)} case lỗi: {e}")
+            failed.update((cid, str(e)) for cid in chunk)
+            continue
+        closed.extend(targets)
+        missing.extend(cid for cid in chunk if cid not in targets)
+
+    return closed, missing, failed
+
 
-    return True
\ No newline at end of file
+def find_cases(status: str = None, page: int = 1, per_page: int = 100,
+               sort_field: str = "updatedAt", sort_order: str = "desc") -> dict:
+    """
+    1 trang của /api/cases/_find (owner securitySolution).
+    Trả về JSON gốc: {"cases": [...], "page", "per_page", "total", ...}
+    """
+    params = {
+        "owner": "securitySolution",
+        "page": page,
+        "perPage": per_page,
+        "sortField": sort_field,
+        "sortOrder": sort_order,
+    }
+    if status:
+        params["status"] = status
+    r = kibana.request("GET", "/api/cases/_find", "find_cases", params=params)
+    return r.json()
@@ -1,102 +1,435 @@
-from elasticsearch import Elasticsearch
+import os
+from app.services.elk.es_client import get_es_client
 from app.utils.helpers import get_nested_value
+from app.utils.ttl_cache import TTLCache
 
-es = Elasticsearch(
-    "https://192.168.10.140:9200",
-    basic_auth=("elastic", "elastic"),
-    verify_certs=False
-)
+METRIC_INDEX = "metricbeat-*"
 
-def get_metric(host_filter=None):
-    metrics = {}
-    try:
-        must_host = []
-        if host_filter:
-            must_host.append({"match": {"host.name": host_filter}})
-
-        if host_filter:
-            host_check = es.search(
-                index="metricbeat-*",
-                size=0,
-                query={"bool": {"must": [{"match": {"host.name": host_filter}}]}},
-                track_total_hits=True
-            )
-            if host_check["hits"]["total"]["value"] == 0:
-                return f"⚠️ Không tìm thấy host `{host_filter}` trong dữ liệu Metricbeat.`"
-
-        def latest(dataset, fields, extra_filter=None):
-            query = {"bool": {"must": [{"match": {"event.dataset": dataset}}] + must_host}}
-            if extra_filter:
-                query["bool"]["filter"] = extra_filter
-            return es.search(
-                index="metricbeat-*",
-                size=1,
-                sort=[{"@timestamp": {"order": "desc"}}],
-                query=query,
-                _source=fields
-            )
-
-        res_cpu = latest("system.cpu", ["host.hostname", "@timestamp", "system.cpu.total.pct"],
-                         [{"exists": {"field": "system.cpu.total.pct"}}])
-        if res_cpu["hits"]["hits"]:
-            src = res_cpu["hits"]["hits"][0]["_source"]
-            metrics["host"] = src.get("host", {}).get("hostname", "unknown")
-            metrics["time"] = src["@timestamp"]
-            metrics["cpu"] = float(get_nested_value(src, "system.cpu.total.pct", 0)) * 100
-
-        res_mem = latest("system.memory", ["system.memory.used.pct", "system.memory.swap.used.pct"],
-                         [{"exists": {"field": "system.memory.used.pct"}}])
-        if res_mem["hits"]["hits"]:
-            src = res_mem["hits"]["hits"][0]["_source"]
-            metrics["mem"] = float(get_nested_value(src, "system.memory.used.pct", 0)) * 100
-            metrics["swap"] = float(get_nested_value(src, "system.memory.swap.used.pct", 0)) * 100
-
-        res_load = latest("system.load", ["system.load.1", "system.load.5", "system.load.15"])
-        if res_load["hits"]["hits"]:
-            src = res_load["hits"]["hits"][0]["_source"]
-            metrics["load1"] = get_nested_value(src, "system.load.1", 0)
-            metrics["load5"] = get_nested_value(src, "system.load.5", 0)
-            metrics["load15"] = get_nested_value(src, "system.load.15", 0)
-
-        res_net = latest("system.network", [
+# Snapshot metric dùng chung giữa các lần gõ /metric trong vài giây
+METRIC_CACHE_TTL = float(os.getenv("METRIC_CACHE_TTL", "5"))
+metric_cache = TTLCache(ttl=METRIC_CACHE_TTL)
+
+
+# ===========================================================
+#  DATASET SPEC: dataset Metricbeat → field cần lấy + filter
+# ===========================================================
+DATASETS = {
+    "cpu": {
+        "dataset": "system.cpu",
+        "fields": ["host.hostname", "@timestamp", "system.cpu.total.pct"],
+        "filter": [{"exists": {"field": "system.cpu.total.pct"}}],
+    },
+    "memory": {
+        "dataset": "system.memory",
+        "fields": ["system.memory.used.pct", "system.memory.swap.used.pct"],
+        "filter": [{"exists": {"field": "system.memory.used.pct"}}],
+    },
+    "load": {
+        "dataset": "system.load",
+        "fields": ["system.load.1", "system.load.5", "system.load.15"],
+        "filter": None,
+    },
+    "network": {
+        "dataset": "system.network",
+        "fields": [
             "system.network.in.bytes",
             "system.network.out.bytes",
             "system.network.in.packets",
             "system.network.out.packets",
             "system.network.in.dropped",
             "system.network.out.dropped"
-        ], [{"exists": {"field": "system.network.in.bytes"}}])
-        if res_net["hits"]["hits"]:
-            src = res_net["hits"]["hits"][0]["_source"]
-            metrics["net_in_mb"] = float(get_nested_value(src, "system.network.in.bytes", 0)) / (1024**2)
-            metrics["net_out_mb"] = float(get_nested_value(src, "system.network.out.bytes", 0)) / (1024**2)
-            metrics["packets_in"] = float(get_nested_value(src, "system.network.in.packets", 0))
-            metrics["packets_out"] = float(get_nested_value(src, "system.network.out.packets", 0))
-            metrics["drop_in"] = float(get_nested_value(src, "system.network.in.dropped", 0))
-            metrics["drop_out"] = float(get_nested_value(src, "system.network.out.dropped", 0))
-
-        res_disk = latest("system.filesystem", ["system.filesystem.used.pct"],
-                          [{"term": {"system.filesystem.mount_point.keyword": "/"}}])
-        if res_disk["hits"]["hits"]:
-            src = res_disk["hits"]["hits"][0]["_source"]
-            metrics["disk"] = float(get_nested_value(src, "system.filesystem.used.pct", 0)) * 100
-
-        res_proc = latest("system.process.summary", ["system.process.summary.total"])
-        if res_proc["hits"]["hits"]:
-            src = res_proc["hits"]["hits"][0]["_source"]
-            metrics["proc_total"] = int(get_nested_value(src, "system.process.summary.total", 0))
-
-        msg = (
-            f"*📊 System Metrics — {metrics.get('host', host_filter or 'unknown')}*\n"
-            f"> 🕓 {metrics.get('time','N/A')}\n"
-            f"> 🖥️ CPU: {metrics.get('cpu',0):.1f}%\n"
-            f"> 💾 Memory: {metrics.get('mem',0):.1f}% | Swap: {metrics.get('swap',0):.1f}%\n"
-            f"> 📈 Load (1/5/15): {metrics.get('load1',0):.2f} / {metrics.get('load5',0):.2f} / {metrics.get('load15',0):.2f}\n"
-            f"> 🌐 Network: {metrics.get('net_in_mb',0):.2f} MB in / {metrics.get('net_out_mb',0):.2f} MB out\n"
-            f"> ⚙️ Processes: {metrics.get('proc_total',0)} total\n"
-            f"> 💽 Disk (/): {metrics.get('disk',0):.1f}%"
+        ],
+        "filter": [{"exists": {"field": "system.network.in.bytes"}}],
+    },
+    "filesystem": {
+        "dataset": "system.filesystem",
+        "fields": ["system.filesystem.used.pct"],
+        "filter": [{"term": {"system.filesystem.mount_point.keyword": "/"}}],
+    },
+    "process": {
+        "dataset": "system.process.summary",
+        "fields": ["system.process.summary.total"],
+        "filter": None,
+    },
+}
+
+
+def _parse_cpu(src, metrics):
+    metrics["host"] = src.get("host", {}).get("hostname", "unknown")
+    metrics["time"] = src["@timestamp"]
+    metrics["cpu"] = float(get_nested_value(src, "system.cpu.total.pct", 0)) * 100
+
+
+def _parse_memory(src, metrics):
+    metrics["mem"] = float(get_nested_value(src, "system.memory.used.pct", 0)) * 100
+    metrics["swap"] = float(get_nested_value(src, "system.memory.swap.used.pct", 0)) * 100
+
+
+def _parse_load(src, metrics):
+    metrics["load1"] = get_nested_value(src, "system.load.1", 0)
+    metrics["load5"] = get_nested_value(src, "system.load.5", 0)
+    metrics["load15"] = get_nested_value(src, "system.load.15", 0)
+
+
+def _parse_network(src, metrics):
+    metrics["net_in_mb"] = float(get_nested_value(src, "system.network.in.bytes", 0)) / (1024**2)
+    metrics["net_out_mb"] = float(get_nested_value(src, "system.network.out.bytes", 0)) / (1024**2)
+    metrics["packets_in"] = float(get_nested_value(src, "system.network.in.packets", 0))
+    metrics["packets_out"] = float(get_nested_value(src, "system.network.out.packets", 0))
+    metrics["drop_in"] = float(get_nested_value(src, "system.network.in.dropped", 0))
+    metrics["drop_out"] = float(get_nested_value(src, "system.network.out.dropped", 0))
+
+
+def _parse_filesystem(src, metrics):
+    metrics["disk"] = float(get_nested_value(src, "system.filesystem.used.pct", 0)) * 100
+
+
+def _parse_process(src, metrics):
+    metrics["proc_total"] = int(get_nested_value(src, "system.process.summary.total", 0))
+
+
+PARSERS = {
+    "cpu": _parse_cpu,
+    "memory": _parse_memory,
+    "load": _parse_load,
+    "network": _parse_network,
+    "filesystem": _parse_filesystem,
+    "process": _parse_process,
+}
+
+
+def _dataset_query(key: str, must_host: list) -> dict:
+    spec = DATASETS[key]
+    query = {"bool": {"must": [{"match": {"event.dataset": spec["dataset"]}}] + must_host}}
+    if spec["filter"]:
+        query["bool"]["filter"] = spec["filter"]
+    return query
+
+
+def _latest_body(key: str, must_host: list) -> dict:
+    return {
+        "size": 1,
+        "sort": [{"@timestamp": {"order": "desc"}}],
+        "query": _dataset_query(key, must_host),
+        "_source": DATASETS[key]["fields"],
+    }
+
+
+def format_metric(metrics: dict, host_filter=None) -> str:
+    return (
+        f"*📊 System Metrics — {metrics.get('host', host_filter or 'unknown')}*\n"
+        f"> 🕓 {metrics.get('time','N/A')}\n"
+        f"> 🖥️ CPU: {metrics.get('cpu',0):.1f}%\n"
+        f"> 💾 Memory: {metrics.get('mem',0):.1f}% | Swap: {metrics.get('swap',0):.1f}%\n"
+        f"> 📈 Load (1/5/15): {metrics.get('load1',0):.2f} / {metrics.get('load5',0):.2f} / {metrics.get('load15',0):.2f}\n"
+        f"> 🌐 Network: {metrics.get('net_in_mb',0):.2f} MB in / {metrics.get('net_out_mb',0):.2f} MB out\n"
+        f"> ⚙️ Processes: {metrics.get('proc_total',0)} total\n"
+        f"> 💽 Disk (/): {metrics.get('disk',0):.1f}%"
+    )
+
+
+def fetch_metrics(host_filter=None, datasets=None):
+    """
+    Sample mới nhất của từng dataset cho 1 host (hoặc toàn bộ nếu không lọc).
+    Trả về None nếu host_filter không có dữ liệu Metricbeat.
+    """
+    datasets = list(datasets or DATASETS)
+    es = get_es_client()
+
+    must_host = []
+    if host_filter:
+        must_host.append({"match": {"host.name": host_filter}})
+
+    # Gom host check + các dataset vào 1 lần _msearch (1 round trip ES)
+    searches = []
+    if host_filter:
+        searches += [{}, {
+            "size": 0,
+            "query": {"bool": {"must": must_host}},
+            "track_total_hits": True,
+        }]
+    for key in datasets:
+        searches += [{}, _latest_body(key, must_host)]
+
+    responses = es.msearch(index=METRIC_INDEX, searches=searches)["responses"]
+
+    if host_filter:
+        host_check = responses.pop(0)
+        if host_check.get("hits", {}).get("total", {}).get("value", 0) == 0:
+            return None
+
+    metrics = {}
+    for key, res in zip(datasets, responses):
+        if "error" in res:
+            print(f"[Metric] {key} query error: {res['error']}")
+            continue
+        hits = res.get("hits", {}).get("hits", [])
+        if hits:
+            PARSERS[key](hits[0]["_source"], metrics)
+    return metrics
+
+
+def get_cached_metrics(host_filter=None, datasets=None):
+    """fetch_metrics qua metric_cache, key = (host_filter, tập dataset)."""
+    datasets = tuple(sorted(datasets or DATASETS))
+    return metric_cache.get_or_load(
+        ("host", host_filter, datasets),
+        lambda: fetch_metrics(host_filter, datasets)
+    )
+
+
+def get_metric(host_filter=None):
+    try:
+        metrics = get_cached_metrics(host_filter)
+        if metrics is None:
+            return f"⚠️ Không tìm thấy host `{host_filter}` trong dữ liệu Metricbeat.`"
+        return format_metric(metrics, host_filter)
+
+    except Exception as e:
+        return f"⚠️ Lỗi khi truy vấn Metricbeat: {e}"
+
+
+# ===========================================================
+#  /metric all — 1 query terms(host.name) + top_hits mỗi dataset
+# ===========================================================
+FLEET_DATASETS = ["cpu", "memory", "load", "filesystem"]
+FLEET_MAX_HOSTS = 200
+FLEET_WINDOW = "15m"
+
+
+def fetch_fleet_metrics(datasets=None, window: str = FLEET_WINDOW) -> list:
+    """
+    Lấy sample mới nhất của từng dataset cho MỌI host trong 1 aggregation.
+    Trả về list dict metrics (cùng key với get_metric), mỗi host 1 dict.
+    """
+    datasets = datasets or FLEET_DATASETS
+    es = get_es_client()
+
+    per_dataset = {
+        key: {
+            "filter": _dataset_query(key, []),
+            "aggs": {
+                "latest": {
+                    "top_hits": {
+                        "size": 1,
+                        "sort": [{"@timestamp": {"order": "desc"}}],
+                        "_source": DATASETS[key]["fields"],
+                    }
+                }
+            },
+        }
+        for key in datasets
+    }
+
+    resp = es.search(
+        index=METRIC_INDEX,
+        size=0,
+        query={"range": {"@timestamp": {"gte": f"now-{window}"}}},
+        aggs={
+            "hosts": {
+                "terms": {"field": "host.name", "size": FLEET_MAX_HOSTS},
+                "aggs": per_dataset,
+            }
+        },
+    )
+
+    fleet = []
+    for bucket in resp.get("aggregations", {}).get("hosts", {}).get("buckets", []):
+        metrics = {}
+        for key in datasets:
+            hits = bucket.get(key, {}).get("latest", {}).get("hits", {}).get("hits", [])
+            if hits:
+                PARSERS[key](hits[0]["_source"], metrics)
+        # host.hostname trong cpu có thể khác host.name → giữ key của bucket
+        metrics["host"] = bucket["key"]
+        fleet.append(metrics)
+    return fleet
+
+
+def _severity(m: dict) -> float:
+    return max(m.get("cpu", 0), m.get("mem", 0), m.get("disk", 0))
+
+
+def format_fleet_metric(fleet: list) -> str:
+    if not fleet:
+        return f"⚠️ Không có host nào gửi Metricbeat trong {FLEET_WINDOW} gần nhất."
+
+    fleet = sorted(fleet, key=_severity, reverse=True)
+    width = max(4, *(len(m["host"]) for m in fleet))
+
+    lines = [f"{'HOST'.ljust(width)}  {'CPU%':>5}  {'MEM%':>5}  {'LOAD1':>5}  {'DISK%':>5}"]
+    for m in fleet:
+        lines.append(
+            f"{m['host'].ljust(width)}  "
+            f"{m.get('cpu', 0):5.1f}  {m.get('mem', 0):5.1f}  "
+            f"{float(m.get('load1', 0)):5.2f}  {m.get('disk', 0):5.1f}"
+        )
+
+    return (
+        f"*📊 Fleet Metrics — {len(fleet)} host(s), sắp xếp theo mức tải cao nhất*\n"
+        "```\n" + "\n".join(lines) + "\n```"
+    )
+
+
+def get_fleet_metric():
+    try:
+        datasets = tuple(sorted(FLEET_DATASETS))
+        fleet = metric_cache.get_or_load(
+            ("fleet", None, datasets),
+            lambda: fetch_fleet_metrics(datasets)
+        )
+        return format_fleet_metric(fleet)
+    except Exception as e:
+        return f"⚠️ Lỗi khi truy vấn Metricbeat: {e}"
+
+
+# ===========================================================
+#  /metric <host> --since 60m — date_histogram avg/max + sparkline
+# ===========================================================
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+HISTORY_BUCKETS = 30
+HISTORY_MIN_INTERVAL = 10      # giây, bằng period mặc định của Metricbeat
+HISTORY_MAX_WINDOW = 24 * 3600
+
+# label → (field, filter riêng nếu có, hệ số nhân để ra đơn vị hiển thị)
+HISTORY_SERIES = {
+    "CPU %": ("system.cpu.total.pct", None, 100),
+    "MEM %": ("system.memory.used.pct", None, 100),
+    "LOAD1": ("system.load.1", None, 1),
+    "DISK %": ("system.filesystem.used.pct",
+               {"term": {"system.filesystem.mount_point.keyword": "/"}}, 100),
+}
+
+
+def parse_window(text: str):
+    """'60m' / '2h' / '90s' → số giây (None nếu sai định dạng)."""
+    units = {"s": 1, "m": 60, "h": 3600}
+    text = (text or "").strip().lower()
+    if len(text) < 2 or text[-1] not in units or not text[:-1].isdigit():
+        return None
+    seconds = int(text[:-1]) * units[text[-1]]
+    return seconds if 0 < seconds <= HISTORY_MAX_WINDOW else None
+
+
+def _series_aggs(field, flt, kinds):
+    aggs = {k: {k: {"field": field}} for k in kinds}
+    if flt:
+        return {"filter": flt, "aggs": aggs}
+    return {"filter": {"exists": {"field": field}}, "aggs": aggs}
+
+
+def _scaled(value, scale):
+    return None if value is None else float(value) * scale
+
+
+def fetch_metric_history(host_filter: str, seconds: int) -> dict:
+    """
+    1 query aggregation: stats toàn window + date_histogram (avg/max mỗi bucket)
+    cho từng series trong HISTORY_SERIES. Trả về None nếu host không có dữ liệu.
+    """
+    es = get_es_client()
+    interval = max(HISTORY_MIN_INTERVAL, seconds // HISTORY_BUCKETS)
+
+    per_bucket = {}
+    overall = {}
+    for idx, (label, (field, flt, _)) in enumerate(HISTORY_SERIES.items()):
+        per_bucket[f"s{idx}"] = _series_aggs(field, flt, ["avg", "max"])
+        overall[f"s{idx}"] = _series_aggs(field, flt, ["stats"])
+
+    resp = es.search(
+        index=METRIC_INDEX,
+        size=0,
+        track_total_hits=True,
+        query={"bool": {
+            "must": [{"match": {"host.name": host_filter}}],
+            "filter": [{"range": {"@timestamp": {"gte": f"now-{seconds}s"}}}],
+        }},
+        aggs={
+            **overall,
+            "timeline": {
+                "date_histogram": {
+                    "field": "@timestamp",
+                    "fixed_interval": f"{interval}s",
+                    "min_doc_count": 0,
+                    "extended_bounds": {"min": f"now-{seconds}s", "max": "now"},
+                },
+                "aggs": per_bucket,
+            },
+        },
+    )
+
+    if resp.get("hits", {}).get("total", {}).get("value", 0) == 0:
+        return None
+
+    aggs = resp.get("aggregations", {})
+    buckets = aggs.get("timeline", {}).get("buckets", [])
+    history = {"interval": interval, "series": {}}
+    for idx, (label, (_, _, scale)) in enumerate(HISTORY_SERIES.items()):
+        key = f"s{idx}"
+        stats = aggs.get(key, {}).get("stats", {})
+        history["series"][label] = {
+            "avg": [_scaled(b.get(key, {}).get("avg", {}).get("value"), scale) for b in buckets],
+            "max": [_scaled(b.get(key, {}).get("max", {}).get("value"), scale) for b in buckets],
+            "min_all": _scaled(stats.get("min"), scale),
+            "avg_all": _scaled(stats.get("avg"), scale),
+            "max_all": _scaled(stats.get("max"), scale),
+        }
+    return history
+
+
+def sparkline(values: list) -> str:
+    """Bucket rỗng (None) hiển thị khoảng trắng; scale theo min..max của series."""
+    present = [v for v in values if v is not None]
+    if not present:
+        return ""
+    lo, hi = min(present), max(present)
+    span = hi - lo
+    chars = []
+    for v in values:
+        if v is None:
+            chars.append(" ")
+        elif span == 0:
+            chars.append(SPARK_CHARS[0])
+        else:
+            chars.append(SPARK_CHARS[round((v - lo) / span * (len(SPARK_CHARS) - 1))])
+    return "".join(chars)
+
+
+def format_metric_history(history: dict, host_filter: str, window: str) -> str:
+    series = history["series"]
+    width = max(len(label) for label in series)
+
+    lines = []
+    for label, s in series.items():
+        if s["max_all"] is None:
+            lines.append(f"{label.ljust(width)}  (không có dữ liệu)")
+            continue
+        lines.append(
+            f"{label.ljust(width)}  {sparkline(s['avg'])}  "
+            f"min {s['min_all']:.1f} / avg {s['avg_all']:.1f} / max {s['max_all']:.1f}"
+        )
+        # Đỉnh ngắn bị avg làm phẳng → hiện thêm đường max của từng bucket
+        lines.append(f"{'  max'.ljust(width)}  {sparkline(s['max'])}")
+
+    return (
+        f"*📈 Metric history — {host_filter} ({window}, bucket {history['interval']}s)*\n"
+        "```\n" + "\n".join(lines) + "\n```"
+    )
+
+
+def get_metric_history(host_filter: str, window: str):
+    seconds = parse_window(window)
+    if not host_filter or seconds is None:
+        return "⚠️ Cú pháp: `/metric <host> --since 60m` (đơn vị s/m/h, tối đa 24h)."
+
+    try:
+        history = metric_cache.get_or_load(
+            ("history", host_filter, seconds),
+            lambda: fetch_metric_history(host_filter, seconds)
         )
-        return msg
+        if history is None:
+            return f"⚠️ Không tìm thấy host `{host_filter}` trong {window} gần nhất."
+        return format_metric_history(history, host_filter, window)
 
     except Exception as e:
         return f"⚠️ Lỗi khi truy vấn Metricbeat: {e}"
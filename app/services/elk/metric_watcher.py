@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from app.services.elk.metric import fetch_fleet_metrics, FLEET_WINDOW
+from app.utils.file_lock import run_as_leader
+
+# ===========================================================
+#  METRIC WATCHER: mỗi N giây 1 query aggregation cho mọi host,
+#  so ngưỡng cpu/mem/disk/load và chỉ post Slack khi trạng thái ĐỔI
+#  (vượt ngưỡng / hồi phục / mất dữ liệu).
+#  Chỉ 1 worker gunicorn chạy (leader giữ flock không chờ).
+# ===========================================================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "../../../"))
+LOCK_PATH = os.path.join(ROOT_DIR, "data", "metric_watcher.lock")
+
+WATCH_INTERVAL = int(os.getenv("METRIC_WATCH_INTERVAL", "60"))   # 0 = tắt
+
+# metric key (giống fetch_fleet_metrics) → (nhãn, ngưỡng)
+THRESHOLDS = {
+    "cpu": ("CPU", float(os.getenv("METRIC_WATCH_CPU", "90"))),
+    "mem": ("Memory", float(os.getenv("METRIC_WATCH_MEM", "90"))),
+    "disk": ("Disk (/)", float(os.getenv("METRIC_WATCH_DISK", "90"))),
+    "load1": ("Load1", float(os.getenv("METRIC_WATCH_LOAD1", "8"))),
+}
+
+# Hồi phục khi xuống dưới ngưỡng * RECOVER_RATIO → tránh spam khi dao động quanh ngưỡng
+RECOVER_RATIO = float(os.getenv("METRIC_WATCH_RECOVER_RATIO", "0.9"))
+
+
+def _fmt(key: str, value: float) -> str:
+    return f"{value:.2f}" if key == "load1" else f"{value:.1f}%"
+
+
+class MetricWatcher:
+    def __init__(self, interval: int = WATCH_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._leader = threading.Event()
+        # host → set metric đang vượt ngưỡng
+        self._breached = {}
+        self._stats_lock = threading.Lock()
+        self.counters = {"runs": 0, "errors": 0, "posted": 0}
+        self.last_duration = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader.is_set()
+
+    def start(self, slack_client, channel: str):
+        if self.interval <= 0 or self._thread:
+            return
+        self._thread = threading.Thread(
+            target=self._run, args=(slack_client, channel),
+            name="metric-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, slack_client, channel):
+        run_as_leader(
+            LOCK_PATH, self.interval, lambda: self.check_once(slack_client, channel),
+            self._stop, self._leader
+        )
+
+    def check_once(self, slack_client, channel):
+        started = time.monotonic()
+        try:
+            fleet = fetch_fleet_metrics(window=FLEET_WINDOW)
+            messages = self.evaluate(fleet)
+        except Exception as e:
+            print(f"[Metric Watcher] query error: {e}")
+            with self._stats_lock:
+                self.counters["errors"] += 1
+            return
+        finally:
+            self.last_duration = time.monotonic() - started
+            with self._stats_lock:
+                self.counters["runs"] += 1
+
+        for msg in messages:
+            try:
+                slack_client.chat_postMessage(channel=channel, text=msg)
+                with self._stats_lock:
+                    self.counters["posted"] += 1
+            except Exception as e:
+                print(f"[Metric Watcher] Slack post error: {e}")
+
+    def evaluate(self, fleet: list) -> list:
+        """Cập nhật state theo snapshot fleet, trả về message cho các transition."""
+        messages = []
+        seen = set()
+
+        for m in fleet:
+            host = m["host"]
+            seen.add(host)
+            prev = self._breached.get(host, set())
+            now = set()
+            for key, (_, limit) in THRESHOLDS.items():
+                value = m.get(key)
+                if value is None:
+                    # Dataset chưa gửi trong FLEET_WINDOW: giữ nguyên trạng thái,
+                    # không báo "hồi phục" giả rồi lại báo vượt ngưỡng ở lần sau
+                    if key in prev:
+                        now.add(key)
+                    continue
+                value = float(value)
+                if value >= limit or (key in prev and value >= limit * RECOVER_RATIO):
+                    now.add(key)
+
+            raised = now - prev
+            cleared = prev - now
+            if raised:
+                details = ", ".join(
+                    f"{THRESHOLDS[k][0]} {_fmt(k, float(m[k]))} ≥ {_fmt(k, THRESHOLDS[k][1])}"
+                    for k in sorted(raised)
+                )
+                messages.append(f"🔥 *{host}* vượt ngưỡng: {details}")
+            if cleared:
+                details = ", ".join(
+                    f"{THRESHOLDS[k][0]} {_fmt(k, float(m[k]))}"
+                    for k in sorted(cleared)
+                )
+                messages.append(f"✅ *{host}* đã hồi phục: {details}")
+
+            if now:
+                self._breached[host] = now
+            else:
+                self._breached.pop(host, None)
+
+        # Host đang có cảnh báo mà ngừng gửi Metricbeat → báo 1 lần rồi bỏ state
+        for host in list(self._breached):
+            if host not in seen:
+                del self._breached[host]
+                messages.append(
+                    f"⚠️ *{host}* không còn gửi Metricbeat trong {FLEET_WINDOW} gần nhất."
+                )
+
+        return messages
+
+    def format(self) -> str:
+        with self._stats_lock:
+            c = dict(self.counters)
+        role = "leader" if self.is_leader else "standby"
+        return (
+            "*🚨 Metric watcher*\n"
+            f"> {role} (process này) | interval {self.interval}s | runs {c['runs']} | "
+            f"errors {c['errors']} | posted {c['posted']} | "
+            f"hosts vượt ngưỡng {len(self._breached)} | last run {self.last_duration * 1000:.0f}ms"
+        )
+
+
+metric_watcher = MetricWatcher()
+
+
+def start_metric_watcher(slack_client, channel: str):
+    metric_watcher.start(slack_client, channel)
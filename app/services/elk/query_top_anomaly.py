@@ -1,13 +1,10 @@
 from elasticsearch import Elasticsearch
 from app.services.elk.extractor_module import extract_payload
+from app.services.elk.es_client import get_es_client
 
 
 def _get_es_client() -> Elasticsearch:
-    return Elasticsearch(
-        ["https://192.168.10.140:9200"],
-        basic_auth=("elastic", "elastic"),
-        verify_certs=False,
-    )
+    return get_es_client()
 
 
 def get_top_requests_last_3h(ip: str, size: int = 100) -> list:
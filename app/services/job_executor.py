@@ -0,0 +1,178 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+
+
+class JobExecutor:
+    """
+    Pool worker cố định cho các job chạy nền (thay cho mỗi request 1 Thread).
+
+    - Mỗi loại job có priority (số nhỏ chạy trước) và giới hạn hàng đợi.
+    - submit() trả về (accepted, position): position = 0 là chạy ngay,
+      > 0 là vị trí trong hàng đợi; accepted = False khi hàng đợi đầy.
+    - metrics() trả về độ dài hàng đợi, thời gian chờ, thời gian chạy.
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._threads = []
+        self._running = 0
+        self._types = {}
+
+    # ---------------- config ----------------
+    def register(self, job_type: str, priority: int = 5, max_queue: int = 20):
+        with self._cond:
+            self._types[job_type] = {
+                "priority": priority,
+                "max_queue": max_queue,
+                "queued": 0,
+                "running": 0,
+                "submitted": 0,
+                "rejected": 0,
+                "completed": 0,
+                "failed": 0,
+                "wait_total": 0.0,
+                "wait_max": 0.0,
+                "run_total": 0.0,
+                "run_max": 0.0,
+            }
+
+    # ---------------- submit ----------------
+    def has_capacity(self, job_type: str) -> bool:
+        with self._cond:
+            t = self._types[job_type]
+            return t["queued"] < t["max_queue"]
+
+    def submit(self, job_type: str, fn, *args, **kwargs):
+        with self._cond:
+            t = self._types[job_type]
+            if t["queued"] >= t["max_queue"]:
+                t["rejected"] += 1
+                return False, None
+
+            self._ensure_workers()
+
+            priority = t["priority"]
+            ahead = sum(1 for p, *_ in self._heap if p <= priority)
+            idle = self.workers - self._running
+            position = 0 if ahead < idle else ahead - idle + 1
+
+            heapq.heappush(
+                self._heap,
+                (priority, next(self._seq), job_type, time.monotonic(), fn, args, kwargs)
+            )
+            t["queued"] += 1
+            t["submitted"] += 1
+            self._cond.notify()
+
+        return True, position
+
+    # ---------------- worker ----------------
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            th = threading.Thread(
+                target=self._worker,
+                name=f"{self.name}-worker-{len(self._threads) + 1}",
+                daemon=True
+            )
+            self._threads.append(th)
+            th.start()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job_type, enqueued_at, fn, args, kwargs = heapq.heappop(self._heap)
+                t = self._types[job_type]
+                t["queued"] -= 1
+                t["running"] += 1
+                self._running += 1
+
+            started = time.monotonic()
+            ok = True
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                ok = False
+                print(f"[Job Executor] {self.name}/{job_type} error: {e}")
+            finished = time.monotonic()
+
+            with self._cond:
+                wait = started - enqueued_at
+                run = finished - started
+                t["running"] -= 1
+                self._running -= 1
+                t["completed" if ok else "failed"] += 1
+                t["wait_total"] += wait
+                t["wait_max"] = max(t["wait_max"], wait)
+                t["run_total"] += run
+                t["run_max"] = max(t["run_max"], run)
+
+    # ---------------- metrics ----------------
+    def metrics(self) -> dict:
+        with self._cond:
+            out = {}
+            for job_type, t in self._types.items():
+                done = t["completed"] + t["failed"]
+                out[job_type] = {
+                    "queued": t["queued"],
+                    "running": t["running"],
+                    "submitted": t["submitted"],
+                    "rejected": t["rejected"],
+                    "completed": t["completed"],
+                    "failed": t["failed"],
+                    "wait_avg": t["wait_total"] / done if done else 0.0,
+                    "wait_max": t["wait_max"],
+                    "run_avg": t["run_total"] / done if done else 0.0,
+                    "run_max": t["run_max"],
+                }
+            return out
+
+
+def format_job_metrics(executor: JobExecutor) -> str:
+    lines = [f"*⚙️ Jobs `{executor.name}`* ({executor.workers} workers)"]
+    for job_type, m in executor.metrics().items():
+        lines.append(
+            f"> `{job_type}`: queue {m['queued']} | running {m['running']} | "
+            f"done {m['completed']} | failed {m['failed']} | rejected {m['rejected']} | "
+            f"wait avg/max {m['wait_avg']:.1f}s/{m['wait_max']:.1f}s | "
+            f"run avg/max {m['run_avg']:.1f}s/{m['run_max']:.1f}s"
+        )
+    return "\n".join(lines)
+
+
+# ===========================================================
+#  THÔNG BÁO HÀNG ĐỢI CHO SLASH COMMAND (dùng chung mọi route)
+# ===========================================================
+def busy_text(command: str) -> str:
+    """Message khi submit bị từ chối vì hàng đợi của lệnh đã đầy."""
+    return f":no_entry: Bot đang bận, hàng đợi `{command}` đã đầy. Thử lại sau."
+
+
+def notify_queued(slack_client, channel: str, user: str, position: int,
+                  command: str = None, thread_ts: str = None):
+    """position > 0 → báo riêng (ephemeral) cho user vị trí của yêu cầu trong hàng đợi."""
+    if not position:
+        return
+    what = f"`{command}`" if command else "yêu cầu"
+    kwargs = {"thread_ts": thread_ts} if thread_ts else {}
+    slack_client.chat_postEphemeral(
+        channel=channel,
+        user=user,
+        text=f":hourglass: Bot đang bận, {what} đã xếp hàng ở vị trí {position}.",
+        **kwargs
+    )
+
+
+# Pool dùng chung cho mọi slash command chạy nền (ES, OpenAI, Slack)
+SLASH_JOB_WORKERS = int(os.getenv("SLASH_JOB_WORKERS", "4"))
+
+slash_jobs = JobExecutor("slash", workers=SLASH_JOB_WORKERS)
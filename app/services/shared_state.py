@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from app.utils.sqlite_db import connect, transaction
+
+# ===========================================================
+#  SHARED STATE giữa các worker process (gunicorn -w N)
+#  Key/value nhỏ lưu trong SQLite WAL, thay cho biến global per-process.
+# ===========================================================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "../../"))
+STORE_DIR = os.path.join(ROOT_DIR, "data")
+DB_PATH = os.path.join(STORE_DIR, "shared_state.db")
+
+os.makedirs(STORE_DIR, exist_ok=True)
+
+_local = threading.local()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key         TEXT PRIMARY KEY,
+    value       TEXT,
+    updated_at  REAL
+);
+
+CREATE TABLE IF NOT EXISTS claims (
+    key         TEXT PRIMARY KEY,
+    expires_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_claims_expires ON claims(expires_at);
+"""
+
+
+def _conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = connect(DB_PATH)
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def get_value(key: str, default=None):
+    row = _conn().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else default
+
+
+def set_value(key: str, value: str):
+    with transaction(_conn()) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, updated_at) VALUES (?, ?, ?)",
+            (key, value, time.time())
+        )
+
+
+def claim_keys(keys: list, ttl: float) -> bool:
+    """
+    Giành quyền xử lý cho 1 nhóm key (vd. event_id, channel:ts) trong ttl giây.
+    Trả về False nếu 1 trong các key đã được process nào đó claim và chưa hết hạn.
+    """
+    now = time.time()
+    with transaction(_conn()) as conn:
+        marks = ",".join("?" * len(keys))
+        row = conn.execute(
+            f"SELECT 1 FROM claims WHERE key IN ({marks}) AND expires_at > ? LIMIT 1",
+            [*keys, now]
+        ).fetchone()
+        if row:
+            return False
+        conn.executemany(
+            "INSERT OR REPLACE INTO claims (key, expires_at) VALUES (?, ?)",
+            [(k, now + ttl) for k in keys]
+        )
+    return True
+
+
+def release_claims(keys: list):
+    """Trả lại claim (vd. xử lý bị từ chối) để lần gửi lại có thể claim tiếp."""
+    if not keys:
+        return
+    with transaction(_conn()) as conn:
+        marks = ",".join("?" * len(keys))
+        conn.execute(f"DELETE FROM claims WHERE key IN ({marks})", list(keys))
+
+
+def prune_claims():
+    with transaction(_conn()) as conn:
+        conn.execute("DELETE FROM claims WHERE expires_at <= ?", (time.time(),))
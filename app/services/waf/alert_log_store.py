@@ -1,57 +1,272 @@
+import copy
 import json
 import os
 import threading
-
-_lock = threading.Lock()
+from contextlib import contextmanager
+from app.utils.file_lock import file_lock
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "../../../"))
 STORE_DIR = os.path.join(ROOT_DIR, "data")
 STORE_PATH = os.path.join(STORE_DIR, "alert_logs.json")
 
+# Journal append-only (NDJSON): mỗi dòng là 1 thao tác ghi.
+# alert_logs.json chỉ còn là snapshot, được ghi lại khi compact.
+JOURNAL_PATH = os.path.join(STORE_DIR, "alert_logs.journal")
+
+# flock dùng chung giữa các worker process (đọc: shared, ghi: exclusive)
+LOCK_PATH = os.path.join(STORE_DIR, "alert_logs.lock")
+
+# Số thao tác trong journal trước khi gộp vào snapshot
+COMPACT_EVERY = int(os.getenv("ALERT_LOG_COMPACT_EVERY", "500"))
+
 os.makedirs(STORE_DIR, exist_ok=True)
 
-if os.path.exists(STORE_PATH):
-    try:
-        with open(STORE_PATH, "r", encoding="utf-8") as f:
-            _LOGS = json.load(f)
-        if not isinstance(_LOGS, dict):
-            _LOGS = {}
-    except json.JSONDecodeError:
-        _LOGS = {}
-else:
-    _LOGS = {}
 
+class AlertLogRepository:
+    """
+    Nguồn đọc/ghi DUY NHẤT cho alert log.
+
+    - Đọc từ index trong RAM, chỉ nạp lại khi snapshot/journal trên đĩa
+      đổi (version = chữ ký snapshot + offset journal).
+    - Ghi = append 1 dòng journal, compact định kỳ vào snapshot.
+    - update(alert_id, fn) chạy read-modify-write trong 1 lock.
+    """
+
+    def __init__(self, snapshot_path=STORE_PATH, journal_path=JOURNAL_PATH,
+                 lock_path=LOCK_PATH, compact_every=COMPACT_EVERY):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.lock_path = lock_path
+        self.compact_every = compact_every
+
+        self._lock = threading.Lock()
+        self._logs = {}
+        self._journal_ops = 0
+        self._journal_offset = 0     # số byte journal đã replay vào _logs
+        self._snapshot_sig = None    # (inode, mtime, size) của snapshot đã load
+
+    # ===================== SNAPSHOT + JOURNAL =====================
+
+    def _load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return {}
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except json.JSONDecodeError:
+            return {}
+
+    def _snapshot_signature(self):
+        try:
+            st = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _journal_size(self) -> int:
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def _apply(self, op: dict):
+        kind = op.get("op")
+        if kind == "set":
+            self._logs[op["id"]] = op["data"]
+        elif kind == "del":
+            for aid in op.get("ids", []):
+                self._logs.pop(aid, None)
+        elif kind == "clear":
+            self._logs.clear()
+
+    def _replay_journal(self, offset: int = 0):
+        """
+        Replay journal từ byte offset. Dòng bị ghi dở (crash giữa chừng)
+        sẽ bị bỏ qua thay vì làm hỏng toàn bộ store.
+        """
+        if not os.path.exists(self.journal_path):
+            self._journal_offset = 0
+            return
+
+        with open(self.journal_path, "rb") as f:
+            f.seek(offset)
+            for raw in f:
+                offset += len(raw)
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    op = json.loads(line.decode("utf-8"))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    print("[Alert Log Store] Bỏ qua dòng journal hỏng")
+                    continue
+                self._apply(op)
+                self._journal_ops += 1
+
+        self._journal_offset = offset
+
+    def _reload(self):
+        self._logs.clear()
+        self._snapshot_sig = self._snapshot_signature()
+        self._logs.update(self._load_snapshot())
+        self._journal_ops = 0
+        self._replay_journal(0)
+
+    def _sync(self):
+        """
+        Bắt kịp thay đổi do process khác ghi (gọi khi đang giữ flock):
+        - snapshot đổi (process khác vừa compact) → load lại toàn bộ
+        - journal dài thêm → chỉ replay phần mới
+        """
+        size = self._journal_size()
+        if self._snapshot_signature() != self._snapshot_sig or size < self._journal_offset:
+            self._reload()
+        elif size > self._journal_offset:
+            self._replay_journal(self._journal_offset)
+
+    def _write_snapshot(self):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._logs, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _compact(self):
+        """
+        Gộp journal vào snapshot: ghi snapshot mới (atomic rename) rồi mới
+        truncate journal, nên crash ở bất kỳ bước nào cũng replay lại được.
+        """
+        self._write_snapshot()
+        with open(self.journal_path, "w", encoding="utf-8"):
+            pass
+        self._journal_ops = 0
+        self._journal_offset = 0
+        self._snapshot_sig = self._snapshot_signature()
+
+    def _append(self, op: dict):
+        # Ghi + fsync journal trước, rồi mới sửa index: ghi lỗi (ENOSPC, EIO) thì
+        # RAM không giữ thay đổi mà đĩa (và các worker khác) không có
+        with open(self.journal_path, "ab") as f:
+            # Dòng cuối bị ghi dở do crash → xuống dòng để không dính vào op mới
+            if f.tell() > 0:
+                with open(self.journal_path, "rb") as r:
+                    r.seek(-1, os.SEEK_END)
+                    if r.read(1) != b"\n":
+                        f.write(b"\n")
+            f.write((json.dumps(op, ensure_ascii=False) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            self._journal_offset = f.tell()
+        self._apply(op)
+        self._journal_ops += 1
+        if self._journal_ops >= self.compact_every:
+            self._compact()
 
-def _save():
-    with open(STORE_PATH, "w", encoding="utf-8") as f:
-        json.dump(_LOGS, f, ensure_ascii=False, indent=2)
+    @contextmanager
+    def _locked(self, shared: bool):
+        """
+        Thread lock + flock (shared khi đọc, exclusive khi ghi),
+        rồi _sync để index khớp với những gì process khác đã ghi.
+        """
+        with self._lock, file_lock(self.lock_path, shared=shared):
+            self._sync()
+            yield
+
+    # ===================== PUBLIC API =====================
+
+    @property
+    def version(self):
+        """Version của dữ liệu đang nằm trong RAM."""
+        return self._snapshot_sig, self._journal_offset
+
+    def get(self, alert_id: str):
+        """Trả về bản copy của alert (sửa bản copy không ảnh hưởng index)."""
+        if not alert_id:
+            return None
+        with self._locked(shared=True):
+            return copy.deepcopy(self._logs.get(alert_id))
+
+    def statuses(self, alert_ids) -> dict:
+        """alert_id → status (lowercase) cho nhiều alert trong 1 lần lock, không copy."""
+        with self._locked(shared=True):
+            return {
+                aid: str(self._logs[aid].get("status", "")).lower()
+                for aid in alert_ids if isinstance(self._logs.get(aid), dict)
+            }
+
+    def save(self, alert_id: str, data: dict):
+        if not alert_id or not isinstance(data, dict):
+            return
+        with self._locked(shared=False):
+            self._append({"op": "set", "id": alert_id, "data": data})
+
+    def update(self, alert_id: str, fn):
+        """
+        Read-modify-write 1 alert trong cùng 1 lock.
+        fn nhận bản copy của alert (None nếu chưa có) và trả về:
+        - dict  → ghi đè alert
+        - None  → xoá alert
+        Trả về giá trị fn trả về.
+        """
+        if not alert_id:
+            return None
+        with self._locked(shared=False):
+            current = self._logs.get(alert_id)
+            result = fn(copy.deepcopy(current))
+            if isinstance(result, dict):
+                self._append({"op": "set", "id": alert_id, "data": result})
+            elif current is not None:
+                self._append({"op": "del", "ids": [alert_id]})
+            return result
+
+    def remove(self, alert_ids: list[str]):
+        if not alert_ids:
+            return
+        with self._locked(shared=False):
+            ids = [aid for aid in alert_ids if aid in self._logs]
+            if ids:
+                self._append({"op": "del", "ids": ids})
+
+    def clear(self):
+        with self._locked(shared=False):
+            self._logs.clear()
+            self._compact()
+
+
+alert_logs = AlertLogRepository()
+
+
+def get_alert_log(alert_id: str):
+    """
+    Đọc alert log từ repository (RAM, tự nạp lại khi file đổi).
+    Không đọc trực tiếp alert_logs.json vì file chỉ là snapshot.
+    """
+    return alert_logs.get(alert_id)
+
+
+def get_alert_statuses(alert_ids) -> dict:
+    return alert_logs.statuses(alert_ids)
+
+
+def update_alert_log(alert_id: str, fn):
+    return alert_logs.update(alert_id, fn)
 
 
 def save_alert_log(alert_id: str, data: dict):
-    if not alert_id or not isinstance(data, dict):
-        return
-    with _lock:
-        _LOGS[alert_id] = data
-        _save()
+    alert_logs.save(alert_id, data)
 
 
 def remove_alert_log(alert_id: str):
     if not alert_id:
         return
-    with _lock:
-        if alert_id in _LOGS:
-            del _LOGS[alert_id]
-            _save()
+    alert_logs.remove([alert_id])
 
 
 def remove_alerts(alert_ids: list[str]):
-    if not alert_ids:
-        return
-    with _lock:
-        for aid in alert_ids:
-            _LOGS.pop(aid, None)
-        _save()
+    alert_logs.remove(alert_ids)
 
 
 # 🔥 NEW: Đánh dấu False Positive
@@ -59,21 +274,15 @@ def mark_false_positive(alert_id: str):
     if not alert_id:
         return False
 
-    with _lock:
-        info = _LOGS.get(alert_id)
-        if not info:
-            return False
-
-        info["status"] = "fp"
-        _save()
+    def _mark(info):
+        if info:
+            info["status"] = "fp"
+        return info
 
-    return True
+    return bool(alert_logs.update(alert_id, _mark))
 
 def clear_logs():
     """
     Xóa toàn bộ logs khỏi RAM và JSON file
     """
-    global _LOGS
-    with _lock:
-        _LOGS = {}
-        _save()
+    alert_logs.clear()
@@ -0,0 +1,180 @@
+import os
+import time
+from app.services.job_executor import JobExecutor
+from app.services.waf.case_store import get_or_create_case
+from app.services.elk.kibana_api import create_case
+from app.services.waf.attachment_batcher import attachment_batcher
+from app.services.elk.query_top_anomaly import get_top_anomaly_requests
+from app.services.waf.alert_log_store import update_alert_log
+from app.utils.latency import LatencyRecorder
+
+# ===========================================================
+#  PIPELINE XỬ LÝ ALERT TỪ SLACK EVENTS
+#  handle_message chỉ enqueue → pool alert worker xử lý
+#  (Kibana case, ES query, lưu log, post Slack) và đo latency từng stage.
+# ===========================================================
+ALERT_WORKERS = int(os.getenv("ALERT_WORKERS", "4"))
+ALERT_QUEUE_LIMIT = int(os.getenv("ALERT_QUEUE_LIMIT", "500"))
+
+# Số request lấy từ ES để lưu log / số request hiển thị trên Slack
+STORE_SIZE = 100
+DISPLAY_SIZE = 5
+
+alert_jobs = JobExecutor("alerts", workers=ALERT_WORKERS)
+alert_jobs.register("alert", priority=1, max_queue=ALERT_QUEUE_LIMIT)
+
+stage_latency = LatencyRecorder()
+
+
+def enqueue_alert(slack_client, alert: dict) -> bool:
+    """
+    alert: {"alert_id", "ip", "channel", "ts"}
+    Trả về False nếu hàng đợi đầy (alert bị bỏ, có log).
+    """
+    alert["enqueued_at"] = time.monotonic()
+    accepted, _ = alert_jobs.submit("alert", process_alert, slack_client, alert)
+    if not accepted:
+        print(f"[Alert Pipeline] Queue full, drop alert {alert.get('alert_id')}")
+    return accepted
+
+
+def process_alert(slack_client, alert: dict):
+    alert_id = alert["alert_id"]
+    ip = alert["ip"]
+
+    stage_latency.record("queue_wait", time.monotonic() - alert["enqueued_at"])
+
+    with stage_latency.timer("total"):
+        # Lỗi Kibana (kể cả KibanaUnavailable khi circuit mở) không được bỏ cả alert:
+        # event đã ACK, Slack không gửi lại → vẫn query ES, lưu log, hiển thị.
+        # Lỗi được đếm ở `errors` của stage "case" (/bot-stats).
+        try:
+            with stage_latency.timer("case"):
+                _resolve_case(ip, alert_id)
+        except Exception as e:
+            print(f"[Alert Pipeline] Case stage lỗi cho alert {alert_id} (IP {ip}): {e}")
+
+        # 1 query ES / alert: cùng sort nên top 5 để hiển thị chính là
+        # 5 request đầu của kết quả dùng để lưu log
+        with stage_latency.timer("es_query"):
+            alert["requests"] = _fetch_anomaly_requests(ip)
+
+        with stage_latency.timer("store_log"):
+            _store_alert_log(ip, alert_id, alert["requests"])
+
+        with stage_latency.timer("slack_display"):
+            _post_top_requests(
+                slack_client, alert["requests"][:DISPLAY_SIZE], alert["channel"], alert["ts"]
+            )
+
+
+# ================== CASE LOGIC ==================
+def _resolve_case(ip: str, alert_id: str):
+    # Single-flight theo IP: alert đồng thời cùng IP chỉ tạo 1 case Kibana
+    case_id = get_or_create_case(ip, create_case)
+
+    # Gom theo case → 1 lần _bulk_create cho nhiều alert; case_store cập nhật sau khi Kibana nhận
+    attachment_batcher.add(case_id, alert_id)
+
+
+def _fetch_anomaly_requests(ip: str) -> list:
+    try:
+        return get_top_anomaly_requests(ip, size=STORE_SIZE) or []
+    except Exception as e:
+        print(f"[Anomaly Query Error] {e}")
+        return []
+
+
+# ================== SAVE ALERT LOG ==================
+def _store_alert_log(ip: str, alert_id: str, reqs: list):
+    try:
+        if not reqs:
+            return
+
+        logs = []
+
+        for idx, r in enumerate(reqs, start=1):
+            # Gộp tags unique
+            tags_lists = r.get("tags") or []
+            flat_tags = sorted({t for group in tags_lists for t in (group or [])})
+
+            matches = r.get("match_d") or []
+            clean_match = [m.strip() for m in matches if m and m.strip()]
+
+            item = {
+                "request_id": idx,
+                "uri": r.get("uri"),
+                "tags": flat_tags,
+                "match": clean_match,
+                "request_headers": r.get("request_headers"),
+                "request_body": r.get("request_body"),
+                "rule_id": r.get("rules"),
+                "data": r.get("datas")
+            }
+
+            logs.append(item)
+
+        # Append vào log cũ của alert nếu có (read-modify-write trong 1 lock)
+        def _append_requests(existing):
+            old_reqs = (existing or {}).get("requests", [])
+            old_reqs.extend(logs)  # APPEND, không overwrite
+            return {
+                "client_ip": ip,
+                "requests": old_reqs
+            }
+
+        update_alert_log(alert_id, _append_requests)
+
+    except Exception as e:
+        print(f"[Store Alert Log Error] {e}")
+
+
+# ============ SHOW TOP ANOMALY REQUESTS ============
+def _post_top_requests(slack_client, reqs: list, channel: str, ts: str):
+    try:
+        if not reqs:
+            return
+
+        for idx, r in enumerate(reqs, start=1):
+            uri = r.get("uri")
+            payload_loc = r.get("payload_location")
+            payload_detect = r.get("payload_detect")
+            payload_decode = r.get("payload_decoded")
+            score = r.get("score")
+            method = r.get("method")
+            tag = r.get("tags")
+            body = r.get("request_body")
+            request_header = r.get("request_headers")
+
+            msg = f"*Request #{idx}*\n"
+            if method:
+                msg += f"*Method:* `{method}`"
+            if score is not None:
+                msg += f" | *Score:* `{score}`"
+            if uri:
+                msg += f"\n*URI:* `{uri}`"
+            if payload_loc:
+                msg += f"\n*Payload Location:* `{payload_loc}`"
+            if payload_decode:
+                msg += f"\n*Payload Decoded:* `{payload_decode}`"
+            if payload_detect:
+                msg += f"\n*Payload Detect:* `{payload_detect}`"
+
+            if tag:
+                msg += f"\n*Tags:* `{tag}`"
+
+            if request_header:
+                msg += f"\n*Headers:* `{request_header}`"
+
+            if body:
+                msg += f"\n*Request Body:* `{body}`"
+
+            # ĐỔI MÀU HIỂN THỊ CODE BLOCK XÁM
+            slack_client.chat_postMessage(
+                channel=channel,
+                text=f"```\n{msg}\n```",
+                thread_ts=ts
+            )
+
+    except Exception as e:
+        print(f"[Slack Extra Display Error] {e}")
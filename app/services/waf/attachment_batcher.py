@@ -0,0 +1,107 @@
+import atexit
+import os
+import threading
+import time
+from app.services.elk.kibana_api import attach_alerts
+from app.services.waf.case_store import append_alerts
+
+# ===========================================================
+#  GOM ATTACH ALERT → KIBANA CASE
+#  Alert của cùng 1 case được giữ tối đa ATTACH_BATCH_WINDOW giây
+#  (hoặc tới ATTACH_BATCH_MAX alert) rồi gửi 1 lần _bulk_create.
+#  Chỉ alert Kibana đã nhận mới được ghi vào case_store.
+# ===========================================================
+ATTACH_BATCH_WINDOW = float(os.getenv("ATTACH_BATCH_WINDOW", "2"))
+ATTACH_BATCH_MAX = int(os.getenv("ATTACH_BATCH_MAX", "50"))
+
+
+class AttachmentBatcher:
+    def __init__(self, window: float = ATTACH_BATCH_WINDOW, max_size: int = ATTACH_BATCH_MAX):
+        self.window = window
+        self.max_size = max_size
+        self._cond = threading.Condition()
+        # case_id → {"alerts": [alert_id...], "deadline": monotonic}
+        self._pending = {}
+        self._thread = None
+        self.counters = {"batches": 0, "attached": 0, "failed": 0}
+
+    def add(self, case_id: str, alert_id: str):
+        """Đưa alert vào batch của case; flush ngay nếu batch đầy."""
+        batch = None
+        with self._cond:
+            self._ensure_thread()
+            entry = self._pending.setdefault(
+                case_id, {"alerts": [], "deadline": time.monotonic() + self.window}
+            )
+            if alert_id not in entry["alerts"]:
+                entry["alerts"].append(alert_id)
+            if len(entry["alerts"]) >= self.max_size:
+                batch = self._pending.pop(case_id)["alerts"]
+            else:
+                self._cond.notify()
+
+        if batch:
+            self._flush(case_id, batch)
+
+    def flush_all(self):
+        with self._cond:
+            pending, self._pending = self._pending, {}
+        for case_id, entry in pending.items():
+            self._flush(case_id, entry["alerts"])
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="attach-batcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                due = [cid for cid, e in self._pending.items() if e["deadline"] <= now]
+                if not due:
+                    next_deadline = min(e["deadline"] for e in self._pending.values())
+                    self._cond.wait(next_deadline - now)
+                    continue
+                batches = [(cid, self._pending.pop(cid)["alerts"]) for cid in due]
+
+            for case_id, alert_ids in batches:
+                self._flush(case_id, alert_ids)
+
+    def _flush(self, case_id: str, alert_ids: list):
+        try:
+            attach_alerts(case_id, alert_ids)
+        except Exception as e:
+            print(f"[Attach Batcher] Attach {len(alert_ids)} alert(s) → case {case_id} lỗi: {e}")
+            with self._cond:
+                self.counters["failed"] += len(alert_ids)
+            return
+
+        try:
+            append_alerts(case_id, alert_ids)
+        except Exception as e:
+            print(f"[Attach Batcher] Lưu alert vào case_store lỗi: {e}")
+
+        with self._cond:
+            self.counters["batches"] += 1
+            self.counters["attached"] += len(alert_ids)
+
+    def format(self) -> str:
+        with self._cond:
+            c = dict(self.counters)
+            waiting = sum(len(e["alerts"]) for e in self._pending.values())
+        avg = c["attached"] / c["batches"] if c["batches"] else 0.0
+        return (
+            "*📎 Kibana attach batches*\n"
+            f"> batches {c['batches']} | attached {c['attached']} (avg {avg:.1f}/batch) | "
+            f"failed {c['failed']} | pending {waiting} | "
+            f"window {self.window:g}s, max {self.max_size}"
+        )
+
+
+attachment_batcher = AttachmentBatcher()
+
+# Tắt process → gửi nốt các batch đang chờ
+atexit.register(attachment_batcher.flush_all)
@@ -1,34 +1,114 @@
-import requests
+import ipaddress
 from app.utils.helpers import is_valid_ip
-
-WAF_API_URL = "http://192.168.10.138:5001"
-WAF_API_TOKEN = "testkey123"
+from app.services.waf.waf_client import waf_client, summarize, OK, EXISTS, MISSING, ERROR
 
 
 def deny_ip(ip):
     """Thêm 1 IP vào blacklist."""
-    try:
-        # --- Kiểm tra IP hợp lệ ---
-        if not is_valid_ip(ip):
-            return f"⚠️ Địa chỉ IP không hợp lệ: {ip}"
-
-        payload = {"ip": ip}
-        resp = requests.post(
-            f"{WAF_API_URL}/blacklist/add",
-            headers={
-                "Authorization": f"Bearer {WAF_API_TOKEN}",
-                "Content-Type": "application/json"
-            },
-            json=payload,
-            timeout=5
+    # --- Kiểm tra IP hợp lệ ---
+    if not is_valid_ip(ip):
+        return f"⚠️ Địa chỉ IP không hợp lệ: {ip}"
+
+    result = waf_client.add("blacklist", ip)
+
+    if result["status"] == OK:
+        return f"✅ Đã thêm IP `{ip}` vào blacklist."
+    elif result["status"] == EXISTS:
+        return f"⚠️ IP `{ip}` đã tồn tại trong blacklist."
+    else:
+        return f"⚠️ {result['detail']}"
+
+
+# ===========================================================
+#  COMPACT BLACKLIST: gộp IP/CIDR liền kề hoặc bị chứa thành tập CIDR nhỏ nhất
+# ===========================================================
+def _entry_str(net) -> str:
+    # /32, /128 ghi dạng IP như lúc /deny thêm vào
+    return str(net.network_address) if net.num_addresses == 1 else str(net)
+
+
+def plan_compaction(entries: list) -> dict:
+    """
+    Tính diff để blacklist về tập CIDR tối thiểu (ipaddress.collapse_addresses).
+    Trả về {"add": [...], "remove": {entry: supernet}, "invalid": [...], "after": N}.
+    Entry không parse được giữ nguyên.
+    """
+    nets, invalid = {}, []
+    for entry in entries:
+        try:
+            nets[entry] = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            invalid.append(entry)
+
+    collapsed = []
+    for version in (4, 6):
+        collapsed += ipaddress.collapse_addresses(
+            n for n in nets.values() if n.version == version
+        )
+
+    target = {_entry_str(n): n for n in collapsed}
+    current = set(nets)
+    remove = {}
+    for entry, net in nets.items():
+        if entry in target:
+            continue
+        remove[entry] = next(
+            key for key, sup in target.items()
+            if sup.version == net.version and net.subnet_of(sup)
         )
 
-        if resp.status_code == 200:
-            return f"✅ Đã thêm IP `{ip}` vào blacklist."
-        elif resp.status_code == 409:
-            return f"⚠️ IP `{ip}` đã tồn tại trong blacklist."
-        else:
-            return f"⚠️ Lỗi API WAF: {resp.status_code} — {resp.text}"
+    return {
+        "add": [key for key in target if key not in current],
+        "remove": remove,
+        "invalid": invalid,
+        "after": len(target) + len(invalid),
+    }
+
+
+def compact_blacklist(dry_run: bool = False) -> dict:
+    """
+    Lấy blacklist hiện tại, thêm các supernet còn thiếu rồi mới xoá các entry bị phủ
+    (chỉ xoá khi supernet phủ nó đã có trên WAF → không có khoảng hở).
+    """
+    entries = waf_client.list("blacklist").get("blacklist", [])
+    plan = plan_compaction(entries)
+    stats = {
+        "before": len(entries), "after": plan["after"],
+        "added": 0, "removed": 0, "errors": {}, "dry_run": dry_run,
+        "planned_add": len(plan["add"]), "planned_remove": len(plan["remove"]),
+    }
+    if dry_run or not (plan["add"] or plan["remove"]):
+        return stats
+
+    added = summarize(waf_client.bulk_add("blacklist", plan["add"]))
+    stats["added"] = len(added[OK])
+    stats["errors"].update(added["errors"])
+
+    # Supernet thêm lỗi → giữ lại các entry con của nó
+    failed = set(added[ERROR])
+    to_remove = [e for e, sup in plan["remove"].items() if sup not in failed]
+    removed = summarize(waf_client.bulk_remove("blacklist", to_remove))
+    stats["removed"] = len(removed[OK]) + len(removed[MISSING])
+    stats["errors"].update(removed["errors"])
+
+    stats["after"] = stats["before"] + stats["added"] - stats["removed"]
+    return stats
+
+
+def format_compaction(stats: dict) -> str:
+    if stats["dry_run"]:
+        return (
+            f"🧮 *Compact blacklist (dry-run)*: `{stats['before']}` → `{stats['after']}` entry "
+            f"(thêm `{stats['planned_add']}` supernet, xoá `{stats['planned_remove']}` entry bị phủ)"
+        )
+    if not (stats["planned_add"] or stats["planned_remove"]):
+        return f"🧮 Blacklist đã tối giản (`{stats['before']}` entry), không cần thay đổi."
 
-    except Exception as e:
-        return f"⚠️ Không kết nối được API WAF: {e}"
+    msg = (
+        f"🧮 *Compact blacklist*: `{stats['before']}` → `{stats['after']}` entry "
+        f"(thêm `{stats['added']}` supernet, xoá `{stats['removed']}` entry bị phủ)"
+    )
+    if stats["errors"]:
+        shown = "\n".join(f"> `{ip}`: {err}" for ip, err in list(stats["errors"].items())[:10])
+        msg += f"\n❌ `{len(stats['errors'])}` lỗi:\n{shown}"
+    return msg
@@ -0,0 +1,502 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from app.utils.sqlite_db import connect, transaction
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "../../../"))
+STORE_DIR = os.path.join(ROOT_DIR, "data")
+JSON_PATH = os.path.join(STORE_DIR, "cases.json")
+DB_PATH = os.path.join(STORE_DIR, "cases.db")
+
+os.makedirs(STORE_DIR, exist_ok=True)
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+def _normalize_case(c: dict) -> dict:
+    """Bổ sung các field thiếu cho case (schema cũ của cases.json)."""
+    c.setdefault("case_id", "")
+    c.setdefault("status", "open")
+    if "alerts" not in c or not isinstance(c["alerts"], list):
+        c["alerts"] = []
+    c.setdefault("created_at", _now())
+    c.setdefault("closed_at", None)
+    c.setdefault("fp_alerts", 0)
+    return c
+
+
+# ===========================================================
+#  JSON BACKEND (logic cũ: dict ip → list case, ghi lại cả file)
+# ===========================================================
+class JsonCaseBackend:
+    def __init__(self, path: str = JSON_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cases = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._cases = data
+            except json.JSONDecodeError:
+                pass
+
+    def _save(self):
+        with open(self.path, "w") as f:
+            json.dump(self._cases, f, indent=2)
+
+    def _ensure_schema(self, ip: str) -> list:
+        cases = self._cases.get(ip)
+        if isinstance(cases, dict):
+            cases = [cases]
+        if not isinstance(cases, list):
+            cases = []
+        self._cases[ip] = [_normalize_case(c) for c in cases]
+        return self._cases[ip]
+
+    @staticmethod
+    def _latest_open(cases: list):
+        for case in reversed(cases):
+            if case.get("status") == "open":
+                return case
+        return None
+
+    def get_open_case(self, ip: str):
+        with self._lock:
+            case = self._latest_open(self._ensure_schema(ip))
+            return dict(case, ip=ip) if case else None
+
+    def add_case(self, ip: str, case_id: str, status: str):
+        with self._lock:
+            self._ensure_schema(ip).append({
+                "case_id": case_id,
+                "status": status,
+                "alerts": [],
+                "created_at": _now(),
+                "closed_at": None,
+                "fp_alerts": 0,
+            })
+            self._save()
+
+    def append_alert(self, ip: str, alert_id: str):
+        with self._lock:
+            case = self._latest_open(self._ensure_schema(ip))
+            if case and alert_id not in case["alerts"]:
+                case["alerts"].append(alert_id)
+                self._save()
+
+    def append_alerts_to_case(self, case_id: str, alert_ids: list) -> int:
+        with self._lock:
+            for ip in list(self._cases):
+                for case in self._ensure_schema(ip):
+                    if case["case_id"] == case_id and case["status"] == "open":
+                        new = [a for a in dict.fromkeys(alert_ids) if a not in case["alerts"]]
+                        case["alerts"].extend(new)
+                        if new:
+                            self._save()
+                        return len(new)
+            return 0
+
+    def update_status(self, ip: str, status: str):
+        with self._lock:
+            case = self._latest_open(self._ensure_schema(ip))
+            if not case:
+                return None
+            case["status"] = status
+            if status == "closed":
+                case["closed_at"] = _now()
+            self._save()
+            return dict(case, ip=ip)
+
+    def find_case(self, case_id: str):
+        with self._lock:
+            for ip, cases in self._cases.items():
+                for c in cases if isinstance(cases, list) else [cases]:
+                    if isinstance(c, dict) and c.get("case_id") == case_id:
+                        return dict(_normalize_case(c), ip=ip)
+            return None
+
+    def close_case(self, case_id: str):
+        with self._lock:
+            for ip in list(self._cases):
+                for c in self._ensure_schema(ip):
+                    if c["case_id"] == case_id and c["status"] == "open":
+                        c["status"] = "closed"
+                        c["closed_at"] = _now()
+                        self._save()
+                        return dict(c, ip=ip)
+            return None
+
+    def detach_alert(self, alert_id: str):
+        removed = 0
+        closed_case_ids = []
+        with self._lock:
+            for ip in list(self._cases):
+                for case in self._ensure_schema(ip):
+                    if case["status"] != "open" or alert_id not in case["alerts"]:
+                        continue
+                    case["fp_alerts"] += 1
+                    if len(case["alerts"]) == 1:
+                        case["alerts"] = []
+                        case["status"] = "closed"
+                        case["closed_at"] = _now()
+                        closed_case_ids.append(case["case_id"])
+                    else:
+                        case["alerts"] = [a for a in case["alerts"] if a != alert_id]
+                    removed += 1
+            self._save()
+        return removed, closed_case_ids
+
+    def remove_alert_for_ip(self, ip: str, alert_id: str) -> bool:
+        with self._lock:
+            for case in self._ensure_schema(ip):
+                if alert_id in case["alerts"]:
+                    case["alerts"].remove(alert_id)
+                    self._save()
+                    return True
+            return False
+
+    def close_cases(self, case_ids: list) -> list:
+        wanted = set(case_ids)
+        closed = []
+        with self._lock:
+            for ip in list(self._cases):
+                for c in self._ensure_schema(ip):
+                    if c["case_id"] in wanted and c["status"] == "open":
+                        c["status"] = "closed"
+                        c["closed_at"] = _now()
+                        closed.append(dict(c, ip=ip))
+            if closed:
+                self._save()
+        return closed
+
+    def list_open(self, created_before: str = None, ip_prefix: str = None) -> list:
+        with self._lock:
+            result = []
+            for ip in list(self._cases):
+                if ip_prefix and not ip.startswith(ip_prefix):
+                    continue
+                for case in self._ensure_schema(ip):
+                    if case["status"] != "open":
+                        continue
+                    if created_before and case["created_at"] >= created_before:
+                        continue
+                    result.append(dict(case, ip=ip))
+            return result
+
+
+# ===========================================================
+#  SQLITE BACKEND (WAL, có index theo ip / case_id / status / alert_id)
+# ===========================================================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    case_id     TEXT NOT NULL,
+    ip          TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'open',
+    created_at  TEXT,
+    closed_at   TEXT,
+    fp_alerts   INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_cases_ip_status ON cases(ip, status);
+CREATE INDEX IF NOT EXISTS idx_cases_case_id ON cases(case_id);
+CREATE INDEX IF NOT EXISTS idx_cases_status ON cases(status);
+CREATE INDEX IF NOT EXISTS idx_cases_status_created ON cases(status, created_at);
+
+CREATE TABLE IF NOT EXISTS case_alerts (
+    case_pk   INTEGER NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+    alert_id  TEXT NOT NULL,
+    PRIMARY KEY (case_pk, alert_id)
+);
+CREATE INDEX IF NOT EXISTS idx_case_alerts_alert ON case_alerts(alert_id);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key    TEXT PRIMARY KEY,
+    value  TEXT
+);
+"""
+
+
+class SqliteCaseBackend:
+    def __init__(self, path: str = DB_PATH, json_path: str = JSON_PATH):
+        self.path = path
+        self._local = threading.local()
+
+        self._conn().executescript(_SCHEMA)
+        self._add_column("cases", "fp_alerts", "INTEGER NOT NULL DEFAULT 0")
+
+        if json_path and os.path.exists(json_path) and not self._meta("json_migrated"):
+            count = migrate_json_to_sqlite(json_path, backend=self)
+            print(f"[Case Store] Migrated {count} case(s) từ {json_path}")
+
+    # ---------------- connection / transaction ----------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def _tx(self):
+        return transaction(self._conn())
+
+    def _add_column(self, table: str, column: str, decl: str):
+        """Thêm cột cho DB tạo bởi schema cũ (CREATE TABLE IF NOT EXISTS không sửa bảng có sẵn)."""
+        conn = self._conn()
+        if column not in {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    def _meta(self, key: str):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    # ---------------- helpers ----------------
+    def _alerts_of(self, conn, pks: list) -> dict:
+        out = {pk: [] for pk in pks}
+        if not pks:
+            return out
+        marks = ",".join("?" * len(pks))
+        rows = conn.execute(
+            f"SELECT case_pk, alert_id FROM case_alerts WHERE case_pk IN ({marks}) ORDER BY rowid",
+            pks
+        )
+        for r in rows:
+            out[r["case_pk"]].append(r["alert_id"])
+        return out
+
+    def _to_dicts(self, conn, rows) -> list:
+        rows = list(rows)
+        alerts = self._alerts_of(conn, [r["id"] for r in rows])
+        return [{
+            "ip": r["ip"],
+            "case_id": r["case_id"],
+            "status": r["status"],
+            "alerts": alerts[r["id"]],
+            "created_at": r["created_at"],
+            "closed_at": r["closed_at"],
+            "fp_alerts": r["fp_alerts"],
+        } for r in rows]
+
+    def _latest_open_row(self, conn, ip: str):
+        return conn.execute(
+            "SELECT * FROM cases WHERE ip = ? AND status = 'open' ORDER BY id DESC LIMIT 1",
+            (ip,)
+        ).fetchone()
+
+    def _close_rows(self, conn, pks: list):
+        if not pks:
+            return
+        marks = ",".join("?" * len(pks))
+        conn.execute(
+            f"UPDATE cases SET status = 'closed', closed_at = ? WHERE id IN ({marks})",
+            [_now(), *pks]
+        )
+
+    # ---------------- public ----------------
+    def get_open_case(self, ip: str):
+        conn = self._conn()
+        row = self._latest_open_row(conn, ip)
+        return self._to_dicts(conn, [row])[0] if row else None
+
+    def add_case(self, ip: str, case_id: str, status: str):
+        with self._tx() as conn:
+            conn.execute(
+                "INSERT INTO cases (case_id, ip, status, created_at) VALUES (?, ?, ?, ?)",
+                (case_id, ip, status, _now())
+            )
+
+    def append_alert(self, ip: str, alert_id: str):
+        with self._tx() as conn:
+            row = self._latest_open_row(conn, ip)
+            if row:
+                conn.execute(
+                    "INSERT OR IGNORE INTO case_alerts (case_pk, alert_id) VALUES (?, ?)",
+                    (row["id"], alert_id)
+                )
+
+    def append_alerts_to_case(self, case_id: str, alert_ids: list) -> int:
+        with self._tx() as conn:
+            row = conn.execute(
+                "SELECT id FROM cases WHERE case_id = ? AND status = 'open' ORDER BY id DESC LIMIT 1",
+                (case_id,)
+            ).fetchone()
+            if not row:
+                return 0
+            cur = conn.executemany(
+                "INSERT OR IGNORE INTO case_alerts (case_pk, alert_id) VALUES (?, ?)",
+                [(row["id"], a) for a in alert_ids]
+            )
+            return cur.rowcount
+
+    def update_status(self, ip: str, status: str):
+        with self._tx() as conn:
+            row = self._latest_open_row(conn, ip)
+            if not row:
+                return None
+            if status == "closed":
+                self._close_rows(conn, [row["id"]])
+            else:
+                conn.execute("UPDATE cases SET status = ? WHERE id = ?", (status, row["id"]))
+            row = conn.execute("SELECT * FROM cases WHERE id = ?", (row["id"],)).fetchone()
+            return self._to_dicts(conn, [row])[0]
+
+    def find_case(self, case_id: str):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT * FROM cases WHERE case_id = ? ORDER BY id DESC LIMIT 1", (case_id,)
+        ).fetchone()
+        return self._to_dicts(conn, [row])[0] if row else None
+
+    def close_case(self, case_id: str):
+        with self._tx() as conn:
+            row = conn.execute(
+                "SELECT * FROM cases WHERE case_id = ? AND status = 'open' ORDER BY id DESC LIMIT 1",
+                (case_id,)
+            ).fetchone()
+            if not row:
+                return None
+            self._close_rows(conn, [row["id"]])
+            row = conn.execute("SELECT * FROM cases WHERE id = ?", (row["id"],)).fetchone()
+            return self._to_dicts(conn, [row])[0]
+
+    def detach_alert(self, alert_id: str):
+        with self._tx() as conn:
+            rows = conn.execute(
+                """
+                SELECT c.id, c.case_id,
+                       (SELECT COUNT(*) FROM case_alerts x WHERE x.case_pk = c.id) AS n
+                FROM case_alerts a JOIN cases c ON c.id = a.case_pk
+                WHERE a.alert_id = ? AND c.status = 'open'
+                """,
+                (alert_id,)
+            ).fetchall()
+
+            conn.execute(
+                "DELETE FROM case_alerts WHERE alert_id = ? AND case_pk IN "
+                "(SELECT id FROM cases WHERE status = 'open')",
+                (alert_id,)
+            )
+            # Ghi nhận case đã có alert bị mark FP (dùng cho /close-case --all-fp)
+            pks = [r["id"] for r in rows]
+            if pks:
+                marks = ",".join("?" * len(pks))
+                conn.execute(f"UPDATE cases SET fp_alerts = fp_alerts + 1 WHERE id IN ({marks})", pks)
+            to_close = [r for r in rows if r["n"] == 1]
+            self._close_rows(conn, [r["id"] for r in to_close])
+
+        return len(rows), [r["case_id"] for r in to_close]
+
+    def remove_alert_for_ip(self, ip: str, alert_id: str) -> bool:
+        with self._tx() as conn:
+            cur = conn.execute(
+                "DELETE FROM case_alerts WHERE alert_id = ? AND case_pk IN "
+                "(SELECT id FROM cases WHERE ip = ?)",
+                (alert_id, ip)
+            )
+            return cur.rowcount > 0
+
+    def close_cases(self, case_ids: list) -> list:
+        if not case_ids:
+            return []
+        with self._tx() as conn:
+            marks = ",".join("?" * len(case_ids))
+            rows = conn.execute(
+                f"SELECT id FROM cases WHERE case_id IN ({marks}) AND status = 'open'",
+                list(case_ids)
+            ).fetchall()
+            pks = [r["id"] for r in rows]
+            self._close_rows(conn, pks)
+            if not pks:
+                return []
+            marks = ",".join("?" * len(pks))
+            rows = conn.execute(f"SELECT * FROM cases WHERE id IN ({marks}) ORDER BY id", pks)
+            return self._to_dicts(conn, rows)
+
+    def list_open(self, created_before: str = None, ip_prefix: str = None) -> list:
+        """
+        Case đang open; ip_prefix lọc bằng range trên index (ip, status):
+        ip >= prefix AND ip < prefix kế tiếp.
+        """
+        sql = "SELECT * FROM cases WHERE status = 'open'"
+        params = []
+        if ip_prefix:
+            sql += " AND ip >= ? AND ip < ?"
+            params += [ip_prefix, ip_prefix[:-1] + chr(ord(ip_prefix[-1]) + 1)]
+        if created_before:
+            sql += " AND created_at < ?"
+            params.append(created_before)
+        conn = self._conn()
+        return self._to_dicts(conn, conn.execute(sql + " ORDER BY id", params))
+
+
+# ===========================================================
+#  MIGRATOR: cases.json → SQLite (chạy 1 lần)
+# ===========================================================
+def migrate_json_to_sqlite(json_path: str = JSON_PATH, backend: SqliteCaseBackend = None) -> int:
+    """
+    Import toàn bộ cases.json vào SQLite trong 1 transaction.
+    Đánh dấu meta.json_migrated để không import lại lần sau.
+    """
+    backend = backend or SqliteCaseBackend(json_path=None)
+
+    try:
+        with open(json_path, "r") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+
+    count = 0
+    with backend._tx() as conn:
+        if conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone():
+            return 0
+
+        for ip, cases in data.items():
+            if isinstance(cases, dict):
+                cases = [cases]
+            if not isinstance(cases, list):
+                continue
+            for c in cases:
+                if not isinstance(c, dict):
+                    continue
+                c = _normalize_case(c)
+                cur = conn.execute(
+                    "INSERT INTO cases (case_id, ip, status, created_at, closed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (c["case_id"], ip, c["status"], c["created_at"], c["closed_at"])
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO case_alerts (case_pk, alert_id) VALUES (?, ?)",
+                    [(cur.lastrowid, aid) for aid in c["alerts"]]
+                )
+                count += 1
+
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+            (_now(),)
+        )
+
+    return count
+
+
+def create_backend(name: str):
+    if name == "json":
+        return JsonCaseBackend()
+    if name == "sqlite":
+        return SqliteCaseBackend()
+    raise ValueError(f"Unknown case store backend: {name}")
+
+
+if __name__ == "__main__":
+    # python -m app.services.waf.case_backends [cases.json]
+    src = sys.argv[1] if len(sys.argv) > 1 else JSON_PATH
+    print(f"Migrated {migrate_json_to_sqlite(src)} case(s) từ {src} → {DB_PATH}")
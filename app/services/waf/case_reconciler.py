@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from app.services.elk.kibana_api import find_cases
+from app.services.shared_state import get_value, set_value
+from app.services.waf.case_store import list_not_confirm, close_cases
+from app.utils.file_lock import run_as_leader
+
+# ===========================================================
+#  ĐỒNG BỘ CASE KIBANA → case_store
+#  Định kỳ đọc các trang /api/cases/_find (status=closed, mới cập nhật trước),
+#  dừng khi gặp case cũ hơn watermark lần chạy trước, rồi đóng local
+#  các case tương ứng trong 1 transaction. Không gọi API theo từng case.
+#  Chỉ 1 worker gunicorn chạy (leader giữ flock không chờ).
+# ===========================================================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "../../../"))
+LOCK_PATH = os.path.join(ROOT_DIR, "data", "case_reconcile.lock")
+
+RECONCILE_INTERVAL = int(os.getenv("CASE_RECONCILE_INTERVAL", "300"))   # 0 = tắt
+RECONCILE_PAGE_SIZE = int(os.getenv("CASE_RECONCILE_PAGE_SIZE", "100"))
+RECONCILE_MAX_PAGES = int(os.getenv("CASE_RECONCILE_MAX_PAGES", "50"))
+
+# updatedAt lớn nhất đã xử lý (dùng chung giữa các worker qua shared_state)
+WATERMARK_KEY = "case_reconcile_watermark"
+
+
+class CaseReconciler:
+    def __init__(self, interval: int = RECONCILE_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._leader = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.counters = {"runs": 0, "errors": 0, "pages": 0, "fetched": 0, "closed_local": 0}
+        self.last = {"pages": 0, "fetched": 0, "closed": 0, "duration": 0.0, "error": None}
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader.is_set()
+
+    def start(self):
+        if self.interval <= 0 or self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="case-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        run_as_leader(LOCK_PATH, self.interval, self.reconcile_once, self._stop, self._leader)
+
+    def reconcile_once(self) -> dict:
+        started = time.monotonic()
+        result = {"pages": 0, "fetched": 0, "closed": 0, "duration": 0.0, "error": None}
+        try:
+            self._reconcile(result)
+        except Exception as e:
+            print(f"[Case Reconcile] {e}")
+            result["error"] = str(e)
+        result["duration"] = time.monotonic() - started
+
+        with self._stats_lock:
+            self.counters["runs"] += 1
+            self.counters["errors"] += 1 if result["error"] else 0
+            self.counters["pages"] += result["pages"]
+            self.counters["fetched"] += result["fetched"]
+            self.counters["closed_local"] += result["closed"]
+            self.last = result
+        return result
+
+    def _reconcile(self, result: dict):
+        open_ids = {c["case_id"] for c in list_not_confirm()}
+        if not open_ids:
+            return
+
+        watermark = get_value(WATERMARK_KEY)
+        newest = None
+        closed_in_kibana = set()
+
+        page = 1
+        while page <= RECONCILE_MAX_PAGES:
+            data = find_cases(status="closed", page=page, per_page=RECONCILE_PAGE_SIZE)
+            cases = data.get("cases", [])
+            result["pages"] += 1
+            result["fetched"] += len(cases)
+
+            reached_watermark = False
+            for c in cases:
+                updated_at = c.get("updated_at") or c.get("updatedAt") or ""
+                if newest is None or updated_at > newest:
+                    newest = updated_at
+                # Case đã thấy ở lần chạy trước → các trang sau còn cũ hơn
+                if watermark and updated_at and updated_at < watermark:
+                    reached_watermark = True
+                    break
+                if c.get("id") in open_ids:
+                    closed_in_kibana.add(c["id"])
+
+            if reached_watermark or len(cases) < RECONCILE_PAGE_SIZE:
+                break
+            page += 1
+
+        if closed_in_kibana:
+            result["closed"] = len(close_cases(list(closed_in_kibana)))
+
+        # Chỉ tiến watermark khi đọc hết (không bị cắt bởi MAX_PAGES)
+        if newest and page <= RECONCILE_MAX_PAGES:
+            set_value(WATERMARK_KEY, newest)
+
+    def format(self) -> str:
+        with self._stats_lock:
+            c = dict(self.counters)
+            last = dict(self.last)
+        role = "leader" if self.is_leader else "standby"
+        line = (
+            "*🔄 Kibana case reconcile*\n"
+            f"> {role} (process này) | interval {self.interval}s | runs {c['runs']} | "
+            f"errors {c['errors']} | pages {c['pages']} | fetched {c['fetched']} | "
+            f"closed local {c['closed_local']}\n"
+            f"> lần cuối: {last['pages']} page, {last['fetched']} case, "
+            f"đóng {last['closed']}, {last['duration'] * 1000:.0f}ms"
+        )
+        if last["error"]:
+            line += f" | lỗi: `{last['error']}`"
+        return line
+
+
+case_reconciler = CaseReconciler()
+
+
+def start_case_reconciler():
+    case_reconciler.start()
@@ -1,122 +1,183 @@
-import json
+import ipaddress
 import os
-import threading
-from datetime import datetime
-from app.services.waf.alert_log_store import remove_alerts, _LOGS
-
-_lock = threading.Lock()
-
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "../../../"))
-STORE_DIR = os.path.join(ROOT_DIR, "data")
-STORE_PATH = os.path.join(STORE_DIR, "cases.json")
-
-os.makedirs(STORE_DIR, exist_ok=True)
-
-if os.path.exists(STORE_PATH):
-    try:
-        with open(STORE_PATH, "r") as f:
-            _CASES = json.load(f)
-        if not isinstance(_CASES, dict):
-            _CASES = {}
-    except json.JSONDecodeError:
-        _CASES = {}
-else:
-    _CASES = {}
-
-
-def _save():
-    with open(STORE_PATH, "w") as f:
-        json.dump(_CASES, f, indent=2)
-
-
-def _ensure_schema(ip: str):
-    updated = False
-    cases = _CASES.get(ip)
-
-    if isinstance(cases, dict):
-        _CASES[ip] = [cases]
-        cases = _CASES[ip]
-        updated = True
-
-    if cases is None or not isinstance(cases, list):
-        _CASES[ip] = []
-        updated = True
-
-    for c in _CASES[ip]:
-        if "case_id" not in c:
-            c["case_id"] = ""
-            updated = True
-        if "status" not in c:
-            c["status"] = "open"
-            updated = True
-        if "alerts" not in c or not isinstance(c["alerts"], list):
-            c["alerts"] = []
-            updated = True
-        if "created_at" not in c:
-            c["created_at"] = datetime.utcnow().isoformat()
-            updated = True
-        if "closed_at" not in c:
-            c["closed_at"] = None
-            updated = True
-
-    if updated:
-        _save()
+import zlib
+from datetime import datetime, timedelta
+from app.services.waf.alert_log_store import remove_alerts, get_alert_log, get_alert_statuses
+from app.services.waf.case_backends import create_backend, STORE_DIR
+from app.utils.file_lock import file_lock
+from app.utils.keyed_lock import KeyedLock
+
+# Backend lưu case: "sqlite" (mặc định, WAL + index) hoặc "json" (cases.json cũ)
+# Chạy nhiều worker process (gunicorn) thì bắt buộc dùng "sqlite".
+CASE_STORE_BACKEND = os.getenv("CASE_STORE_BACKEND", "sqlite")
+
+_backend = create_backend(CASE_STORE_BACKEND)
+
+# Khoá tạo case theo IP: trong process (KeyedLock) + giữa các worker (flock, chia N stripe)
+CASE_LOCK_DIR = os.path.join(STORE_DIR, "case_locks")
+CASE_LOCK_STRIPES = 64
+_ip_locks = KeyedLock()
 
 
 def get_case(ip: str):
     if not ip:
         return None
-    with _lock:
-        _ensure_schema(ip)
-        for case in reversed(_CASES.get(ip, [])):
-            if case.get("status") == "open":
-                return case
-        return None
+    return _backend.get_open_case(ip)
 
 
 def save_case(ip: str, case_id: str, status: str = "open"):
     if not ip or not case_id:
         return
-    with _lock:
-        _ensure_schema(ip)
-        new_case = {
-            "case_id": case_id,
-            "status": status,
-            "alerts": [],
-            "created_at": datetime.utcnow().isoformat(),
-            "closed_at": None,
-        }
-        _CASES[ip].append(new_case)
-        _save()
+    _backend.add_case(ip, case_id, status)
+
+
+def get_or_create_case(ip: str, create_fn) -> str:
+    """
+    Trả về case_id đang open của IP; chưa có thì gọi create_fn(ip) (tạo trên Kibana)
+    rồi lưu lại. Các alert đồng thời cùng IP (kể cả ở worker khác) chờ 1 lần tạo
+    duy nhất và dùng chung case_id đó.
+    """
+    case = get_case(ip)
+    if case:
+        return case["case_id"]
+
+    stripe = zlib.crc32(ip.encode()) % CASE_LOCK_STRIPES
+    with _ip_locks.hold(ip), file_lock(os.path.join(CASE_LOCK_DIR, f"{stripe}.lock")):
+        # Kiểm tra lại: thread/process đi trước có thể vừa tạo xong
+        case = get_case(ip)
+        if case:
+            return case["case_id"]
+
+        case_id = create_fn(ip)
+        save_case(ip, case_id, "open")
+        return case_id
 
 
 def append_alert(ip: str, alert_id: str):
     if not ip or not alert_id:
         return
-    with _lock:
-        _ensure_schema(ip)
-        for case in reversed(_CASES[ip]):
-            if case["status"] == "open":
-                if alert_id not in case["alerts"]:
-                    case["alerts"].append(alert_id)
-                    _save()
-                return
+    _backend.append_alert(ip, alert_id)
+
+
+def append_alerts(case_id: str, alert_ids: list) -> int:
+    """
+    Ghi nhiều alert vào đúng case_id (nếu case còn open) trong 1 lần ghi.
+    Trả về số alert mới được thêm.
+    """
+    if not case_id or not alert_ids:
+        return 0
+    return _backend.append_alerts_to_case(case_id, alert_ids)
 
 
 def update_status(ip: str, status: str):
     if not ip:
         return
-    with _lock:
-        _ensure_schema(ip)
-        for case in reversed(_CASES[ip]):
-            if case.get("status") == "open":
-                case["status"] = status
-                if status == "closed":
-                    case["closed_at"] = datetime.utcnow().isoformat()
-                    remove_alerts(case.get("alerts"))
-                _save()
-                return
+    case = _backend.update_status(ip, status)
+    if case and status == "closed":
+        remove_alerts(case.get("alerts"))
+
+
+def find_case(case_id: str):
+    """
+    Tìm case theo case_id (kèm field "ip").
+    Trả về None nếu không có.
+    """
+    if not case_id:
+        return None
+    return _backend.find_case(case_id)
+
+
+def close_case(case_id: str):
+    """
+    Đóng đúng case có case_id (nếu đang open) và xoá alert log của case.
+    """
+    if not case_id:
+        return None
+    case = _backend.close_case(case_id)
+    if case:
+        remove_alerts(case.get("alerts"))
+    return case
+
+
+def close_cases(case_ids: list) -> list:
+    """
+    Đóng nhiều case (theo case_id) trong 1 transaction, xoá alert log của chúng.
+    Trả về list case đã đóng (kèm "ip").
+    """
+    if not case_ids:
+        return []
+    closed = _backend.close_cases(case_ids)
+    remove_alerts([a for case in closed for a in case.get("alerts", [])])
+    return closed
+
+
+def _ip_prefix(network) -> str:
+    """
+    Tiền tố chuỗi chung của mọi IPv4 trong network (các octet nằm trọn trong mask),
+    để backend lọc theo range trên index. IPv6 / mask < /8 → None (quét hết).
+    """
+    if network.version != 4 or network.prefixlen < 8:
+        return None
+    if network.prefixlen == 32:
+        return str(network.network_address)
+    octets = str(network.network_address).split(".")
+    return ".".join(octets[:network.prefixlen // 8]) + "."
+
+
+def find_open_cases(cidr: str = None, older_than: timedelta = None, all_fp: bool = False) -> list:
+    """
+    Lọc case đang open (các điều kiện kết hợp AND):
+    - cidr: IP của case nằm trong dải (vd. 10.0.0.0/24 hoặc 1 IP)
+    - older_than: tạo cách đây lâu hơn khoảng thời gian này
+    - all_fp: case đã có alert bị mark FP (mark-fp gỡ alert khỏi case, đếm ở
+      fp_alerts) hoặc còn giữ alert FP, và mọi alert còn lại đều là FP hoặc
+      không còn log (đã bị xoá) → không còn alert thật nào cần xử lý.
+      Case mới chưa có alert (alert còn nằm trong batcher) không bị tính.
+    """
+    created_before = None
+    if older_than:
+        created_before = (datetime.utcnow() - older_than).isoformat()
+
+    network = ipaddress.ip_network(cidr, strict=False) if cidr else None
+    cases = _backend.list_open(
+        created_before=created_before,
+        ip_prefix=_ip_prefix(network) if network else None
+    )
+
+    if network:
+        # Prefix chỉ thu hẹp theo octet → kiểm tra chính xác phần còn lại
+        def _in_network(ip):
+            try:
+                return ipaddress.ip_address(ip) in network
+            except ValueError:
+                return False
+
+        cases = [c for c in cases if _in_network(c["ip"])]
+
+    if all_fp:
+        statuses = get_alert_statuses({a for c in cases for a in c["alerts"]})
+
+        def _all_fp(case):
+            # None = alert không còn log (clear-logs / đã dọn)
+            remaining = [statuses.get(a) for a in case["alerts"]]
+            if any(s not in (None, "fp") for s in remaining):
+                return False
+            return case.get("fp_alerts", 0) > 0 or "fp" in remaining
+
+        cases = [c for c in cases if _all_fp(c)]
+
+    return cases
+
+
+def detach_alert(alert_id: str):
+    """
+    Gỡ alert (FP) khỏi mọi case đang open trong 1 transaction.
+    Case chỉ còn đúng alert này sẽ bị đóng luôn.
+    Trả về (số case bị gỡ alert, list case_id đã đóng).
+    """
+    if not alert_id:
+        return 0, []
+    return _backend.detach_alert(alert_id)
 
 
 # 🔥 NEW: Gỡ alert khỏi case khi mark-fp
@@ -124,7 +185,7 @@ def remove_alert_from_cases(alert_id: str):
     if not alert_id:
         return False
 
-    alert_info = _LOGS.get(alert_id)
+    alert_info = get_alert_log(alert_id)
     if not alert_info:
         return False
 
@@ -132,31 +193,17 @@ def remove_alert_from_cases(alert_id: str):
     if not ip:
         return False
 
-    with _lock:
-        _ensure_schema(ip)
-        for case in _CASES[ip]:
-            alerts = case.get("alerts", [])
-            if alert_id in alerts:
-                alerts.remove(alert_id)
-                case["alerts"] = alerts
-                _save()
-                return True
-
-    return False
+    return _backend.remove_alert_for_ip(ip, alert_id)
 
 
 def list_not_confirm():
-    with _lock:
-        result = []
-        for ip, cases in _CASES.items():
-            _ensure_schema(ip)
-            for case in cases:
-                if case["status"] == "open":
-                    result.append({
-                        "ip": ip,
-                        "case_id": case["case_id"],
-                        "status": case["status"],
-                        "alerts": case["alerts"],
-                        "created_at": case.get("created_at"),
-                    })
-        return result
+    return [
+        {
+            "ip": case["ip"],
+            "case_id": case["case_id"],
+            "status": case["status"],
+            "alerts": case["alerts"],
+            "created_at": case.get("created_at"),
+        }
+        for case in _backend.list_open()
+    ]
@@ -1,8 +1,10 @@
-import requests
 from app.utils.helpers import is_valid_ip
+from app.services.waf.waf_client import waf_client, OK, MISSING
+
+
+def _mode(ip_type):
+    return "whitelist" if ip_type == "ip_whitelist" else "blacklist"
 
-WAF_API_URL = "http://192.168.10.138:5001"
-WAF_API_TOKEN = "testkey123"
 
 def delete_ip(ip_type, ip):
     """
@@ -10,29 +12,14 @@ def delete_ip(ip_type, ip):
     ip_type: 'ip_whitelist' hoặc 'ip_blacklist'
     ip: địa chỉ IP cần xóa
     """
-    try:
-        endpoint = "/whitelist/remove" if ip_type == "ip_whitelist" else "/blacklist/remove"
-        
-        if not is_valid_ip(ip):
-            return f"⚠️ Địa chỉ IP không hợp lệ: {ip}"
-        payload = {"ip": ip}
-
-        resp = requests.post(
-            f"{WAF_API_URL}{endpoint}",
-            headers={
-                "Authorization": f"Bearer {WAF_API_TOKEN}",
-                "Content-Type": "application/json"
-            },
-            json=payload,
-            timeout=5
-        )
+    if not is_valid_ip(ip):
+        return f"⚠️ Địa chỉ IP không hợp lệ: {ip}"
 
-        if resp.status_code == 200:
-            return f"✅ Đã xóa IP `{ip}` khỏi {ip_type}."
-        elif resp.status_code == 404:
-            return f"⚠️ IP `{ip}` không tồn tại trong {ip_type}."
-        else:
-            return f"⚠️ Lỗi API WAF: {resp.status_code} — {resp.text}"
+    result = waf_client.remove(_mode(ip_type), ip)
 
-    except Exception as e:
-        return f"⚠️ Không kết nối được API WAF: {e}"
\ No newline at end of file
+    if result["status"] == OK:
+        return f"✅ Đã xóa IP `{ip}` khỏi {ip_type}."
+    elif result["status"] == MISSING:
+        return f"⚠️ IP `{ip}` không tồn tại trong {ip_type}."
+    else:
+        return f"⚠️ {result['detail']}"
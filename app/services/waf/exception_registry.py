@@ -0,0 +1,187 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from app.utils.sqlite_db import connect, transaction
+from app.services.waf.exception_rule_client import apply_exception_rule
+
+# ===========================================================
+#  REGISTRY EXCEPTION RULE
+#  - Cấp Rule ID tăng dần (không random, không dùng lại) theo dải của từng PP
+#  - Hash nội dung rule đã chuẩn hoá (bỏ ID, gộp khoảng trắng)
+#    → gửi lại đúng rule đã áp dụng thì trả kết quả cũ, KHÔNG reload WAF
+# ===========================================================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, "../../../"))
+STORE_DIR = os.path.join(ROOT_DIR, "data")
+DB_PATH = os.path.join(STORE_DIR, "exception_rules.db")
+
+os.makedirs(STORE_DIR, exist_ok=True)
+
+# Dải Rule ID của các PP có sinh SecRule riêng
+ID_RANGES = {
+    "pp1": (100000, 199999),
+    "pp3": (900000, 999999),
+}
+
+# ID bắt đầu cấp cho từng PP. Rule cũ (trước registry) dùng ID random trong cả dải,
+# registry không biết → đặt START lớn hơn ID lớn nhất đang có trên WAF.
+# Counter chỉ tăng: START lớn hơn counter hiện tại thì nhảy lên START.
+ID_STARTS = {
+    pp: int(os.getenv(f"EXCEPTION_RULE_ID_START_{pp.upper()}", str(low)))
+    for pp, (low, _) in ID_RANGES.items()
+}
+
+# WAF báo trùng ID (rule cũ ngoài registry) → cấp ID kế tiếp, thử tối đa N lần
+ID_CONFLICT_RETRIES = int(os.getenv("EXCEPTION_RULE_ID_CONFLICT_RETRIES", "5"))
+_ID_CONFLICT_RE = re.compile(r"same id|duplicate (rule )?id|id .*already", re.IGNORECASE)
+
+# Rule "pending" quá lâu (process chết giữa chừng) được coi như failed → cho áp dụng lại
+PENDING_TIMEOUT = 600
+
+_ID_PLACEHOLDER = "{RULE_ID}"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    pp            TEXT NOT NULL,
+    content_hash  TEXT NOT NULL UNIQUE,
+    rule_id       INTEGER,
+    rule          TEXT,
+    status        TEXT NOT NULL,
+    stage         TEXT,
+    created_at    TEXT,
+    applied_at    TEXT,
+    updated_at    REAL
+);
+
+CREATE TABLE IF NOT EXISTS id_counters (
+    pp       TEXT PRIMARY KEY,
+    next_id  INTEGER NOT NULL
+);
+"""
+
+_local = threading.local()
+
+
+def _conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = connect(DB_PATH)
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def canonical_hash(pp: str, rule_template: str) -> str:
+    """Hash nội dung rule (đã thay ID bằng placeholder, gộp khoảng trắng)."""
+    canonical = re.sub(r"\s+", " ", rule_template.replace("\\\n", " ")).strip()
+    return hashlib.sha256(f"{pp}\n{canonical}".encode()).hexdigest()
+
+
+def _allocate_id(conn, pp: str) -> int:
+    low, high = ID_RANGES[pp]
+    row = conn.execute("SELECT next_id FROM id_counters WHERE pp = ?", (pp,)).fetchone()
+    next_id = max(row["next_id"] if row else low, ID_STARTS[pp])
+    if next_id > high:
+        raise RuntimeError(f"Hết Rule ID trong dải {pp.upper()} ({low}-{high})")
+    conn.execute(
+        "INSERT OR REPLACE INTO id_counters (pp, next_id) VALUES (?, ?)", (pp, next_id + 1)
+    )
+    return next_id
+
+
+def _reallocate(pp: str, content_hash: str, build_rule):
+    """Rule ID bị WAF báo trùng → cấp ID mới cho rule đang pending."""
+    with transaction(_conn()) as conn:
+        rule_id = _allocate_id(conn, pp)
+        rule = build_rule(rule_id)
+        conn.execute(
+            "UPDATE rules SET rule_id = ?, rule = ?, updated_at = ? WHERE content_hash = ?",
+            (rule_id, rule, time.time(), content_hash)
+        )
+    return rule_id, rule
+
+
+def apply_rule(pp: str, build_rule) -> dict:
+    """
+    Áp dụng exception rule qua registry.
+    build_rule: chuỗi rule, hoặc hàm build_rule(rule_id) -> chuỗi rule (PP có dải ID).
+    Trả về dict: rule, rule_id, duplicate, success, ts, stage, err_msg.
+    Rule giống hệt rule đã áp dụng (hoặc đang áp dụng) → duplicate=True, không gọi WAF.
+    """
+    uses_id = callable(build_rule) and pp in ID_RANGES
+    template = build_rule(_ID_PLACEHOLDER) if uses_id else build_rule
+    content_hash = canonical_hash(pp, template)
+    now = time.time()
+
+    with transaction(_conn()) as conn:
+        row = conn.execute("SELECT * FROM rules WHERE content_hash = ?", (content_hash,)).fetchone()
+        in_flight = row and row["status"] == "pending" and now - row["updated_at"] < PENDING_TIMEOUT
+        if row and (row["status"] == "applied" or in_flight):
+            return {
+                "rule": row["rule"],
+                "rule_id": row["rule_id"],
+                "duplicate": True,
+                "success": row["status"] == "applied",
+                "ts": row["applied_at"],
+                "stage": row["stage"] or row["status"],
+                "err_msg": None,
+            }
+
+        if row:
+            # Lần trước lỗi → áp dụng lại với đúng Rule ID cũ
+            rule_id = row["rule_id"]
+            rule = row["rule"] or (build_rule(rule_id) if uses_id else build_rule)
+            conn.execute(
+                "UPDATE rules SET status = 'pending', updated_at = ? WHERE id = ?", (now, row["id"])
+            )
+        else:
+            rule_id = _allocate_id(conn, pp) if uses_id else None
+            # Lưu rule ngay lúc insert: lệnh trùng đến khi còn pending vẫn hiển thị được rule
+            rule = build_rule(rule_id) if uses_id else build_rule
+            conn.execute(
+                "INSERT INTO rules (pp, content_hash, rule_id, rule, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'pending', ?, ?)",
+                (pp, content_hash, rule_id, rule, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), now)
+            )
+
+    success, ts, stage, err_msg = apply_exception_rule(rule)
+    for _ in range(ID_CONFLICT_RETRIES if uses_id else 0):
+        if success or not _ID_CONFLICT_RE.search(err_msg or ""):
+            break
+        rule_id, rule = _reallocate(pp, content_hash, build_rule)
+        success, ts, stage, err_msg = apply_exception_rule(rule)
+
+    with transaction(_conn()) as conn:
+        conn.execute(
+            "UPDATE rules SET status = ?, stage = ?, applied_at = ?, updated_at = ? "
+            "WHERE content_hash = ?",
+            ("applied" if success else "failed", stage, ts if success else None,
+             time.time(), content_hash)
+        )
+
+    return {
+        "rule": rule,
+        "rule_id": rule_id,
+        "duplicate": False,
+        "success": success,
+        "ts": ts,
+        "stage": stage,
+        "err_msg": err_msg,
+    }
+
+
+def format_duplicate(method_used: str, result: dict) -> str:
+    """Header Slack cho rule trùng (không reload WAF)."""
+    if result["success"]:
+        state = f"- Đã áp dụng lúc: `{result['ts']}`\n"
+    else:
+        state = "- Rule giống hệt đang được áp dụng bởi lệnh khác\n"
+    rule_id = f"- Rule ID: `{result['rule_id']}`\n" if result["rule_id"] else ""
+    return (
+        f":information_source: **{method_used} đã tồn tại — bỏ qua, không reload WAF**\n"
+        f"{rule_id}{state}"
+    )
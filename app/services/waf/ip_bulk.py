@@ -0,0 +1,203 @@
+import ipaddress
+import os
+import re
+import time
+import requests
+from app.services.waf.waf_client import waf_client, summarize, OK, EXISTS
+from app.services.waf.ip_lists import ip_lists
+
+# ===========================================================
+#  /deny, /allow NHIỀU IP
+#  Input: IP / CIDR cách nhau bởi dấu cách, dấu phẩy hoặc xuống dòng,
+#  và/hoặc file Slack (file id F… hoặc link file) chứa danh sách IP.
+#  Parse + validate dạng stream, bỏ trùng (trong input và với list hiện tại),
+#  áp dụng theo batch có giới hạn tốc độ, trả về 1 message tổng kết.
+# ===========================================================
+BULK_BATCH_SIZE = int(os.getenv("WAF_BULK_BATCH_SIZE", "50"))
+BULK_BATCH_INTERVAL = float(os.getenv("WAF_BULK_BATCH_INTERVAL", "1"))
+BULK_MAX_ENTRIES = int(os.getenv("WAF_BULK_MAX_ENTRIES", "5000"))
+BULK_MAX_FILE_BYTES = int(os.getenv("WAF_BULK_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+
+# CIDR rộng hơn mức này bị từ chối (0.0.0.0/0 = chặn / whitelist toàn bộ Internet)
+MIN_PREFIX = {
+    4: int(os.getenv("WAF_MIN_PREFIX_V4", "16")),
+    6: int(os.getenv("WAF_MIN_PREFIX_V6", "48")),
+}
+
+_SPLIT_RE = re.compile(r"[\s,;]+")
+_FILE_ID_RE = re.compile(r"(?:^|[/-])(F[A-Z0-9]{8,})(?:[/?]|$)")
+
+# Số mục lỗi tối đa liệt kê trong message tổng kết
+_SHOW = 10
+
+
+def find_file_id(token: str):
+    """File id Slack (F…) từ token hoặc link file (files.slack.com / permalink)."""
+    token = token.strip("<>")
+    if re.fullmatch(r"F[A-Z0-9]{8,}", token):
+        return token
+    if "slack.com" in token:
+        m = _FILE_ID_RE.search(token.split("|")[0])
+        return m.group(1) if m else None
+    return None
+
+
+def iter_file_lines(slack_client, file_id: str):
+    """Stream từng dòng của file Slack (không tải cả file vào RAM)."""
+    info = slack_client.files_info(file=file_id)["file"]
+    if info.get("size", 0) > BULK_MAX_FILE_BYTES:
+        raise ValueError(f"file `{info.get('name', file_id)}` vượt quá {BULK_MAX_FILE_BYTES} bytes")
+
+    url = info.get("url_private_download") or info.get("url_private")
+    with requests.get(
+        url,
+        headers={"Authorization": f"Bearer {slack_client.token}"},
+        stream=True,
+        timeout=(5, 30)
+    ) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines(decode_unicode=True):
+            yield line
+
+
+def iter_tokens(lines):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "ignore")
+        line = line.split("#", 1)[0]
+        for token in _SPLIT_RE.split(line):
+            if token:
+                yield token
+
+
+def normalize_target(token: str):
+    """
+    IP → dạng chuẩn; CIDR → network chuẩn (/32, /128 thành IP).
+    None nếu sai hoặc CIDR rộng hơn MIN_PREFIX.
+    """
+    try:
+        if "/" not in token:
+            return str(ipaddress.ip_address(token))
+        net = ipaddress.ip_network(token, strict=False)
+    except ValueError:
+        return None
+    if net.prefixlen < MIN_PREFIX[net.version]:
+        return None
+    if net.num_addresses == 1:
+        return str(net.network_address)
+    return str(net)
+
+
+def _invalid_label(token: str) -> str:
+    try:
+        net = ipaddress.ip_network(token, strict=False)
+    except ValueError:
+        return token
+    return f"{token} (rộng hơn /{MIN_PREFIX[net.version]})"
+
+
+def iter_targets(tokens, stats: dict, is_present):
+    """
+    Validate + bỏ trùng dạng stream, cập nhật stats (invalid / duplicate / present).
+    is_present(target): True nếu target đã có (hoặc bị phủ) trong list hiện tại.
+    """
+    seen = set()
+    for token in tokens:
+        target = normalize_target(token)
+        if target is None:
+            stats["invalid"].append(_invalid_label(token))
+            continue
+        if target in seen:
+            stats["duplicate"] += 1
+            continue
+        seen.add(target)
+        if is_present(target):
+            stats["present"] += 1
+            continue
+        if len(seen) > BULK_MAX_ENTRIES:
+            stats["truncated"] = True
+            return
+        yield target
+
+
+def _batches(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def apply_bulk_add(mode: str, lines) -> dict:
+    """
+    Thêm mọi IP/CIDR trong lines vào list `mode`, theo batch BULK_BATCH_SIZE,
+    nghỉ BULK_BATCH_INTERVAL giây giữa các batch. Trả về stats tổng hợp.
+    """
+    stats = {
+        "added": 0, "present": 0, "duplicate": 0, "invalid": [],
+        "errors": {}, "batches": 0, "truncated": False,
+    }
+
+    # Mirror local (RadixTree): IP đã nằm trong 1 CIDR của list cũng tính là "đã có"
+    ip_lists.refresh(mode)
+    existing = set(ip_lists.entries(mode))
+
+    def _is_present(target):
+        return target in existing or ("/" not in target and ip_lists.contains(mode, target))
+
+    targets = iter_targets(iter_tokens(lines), stats, _is_present)
+
+    for i, batch in enumerate(_batches(targets, BULK_BATCH_SIZE)):
+        if i:
+            time.sleep(BULK_BATCH_INTERVAL)
+        summary = summarize(waf_client.bulk_add(mode, batch))
+        stats["batches"] += 1
+        stats["added"] += len(summary[OK])
+        stats["present"] += len(summary[EXISTS])
+        stats["errors"].update(summary["errors"])
+
+    return stats
+
+
+def format_bulk_summary(mode: str, stats: dict, user_id: str = None) -> str:
+    icon = "🚫" if mode == "blacklist" else "📜"
+    who = f"<@{user_id}> " if user_id else ""
+    msg = (
+        f"{icon} {who}cập nhật *{mode}*: "
+        f"✅ thêm `{stats['added']}` | ↩️ đã có `{stats['present']}` | "
+        f"♻️ trùng trong input `{stats['duplicate']}` | "
+        f"⚠️ không hợp lệ `{len(stats['invalid'])}` | ❌ lỗi `{len(stats['errors'])}` "
+        f"({stats['batches']} batch)"
+    )
+    if stats["invalid"]:
+        shown = ", ".join(f"`{t}`" for t in stats["invalid"][:_SHOW])
+        msg += f"\n> Không hợp lệ: {shown}{' …' if len(stats['invalid']) > _SHOW else ''}"
+    if stats["errors"]:
+        shown = "\n".join(f"> `{ip}`: {err}" for ip, err in list(stats["errors"].items())[:_SHOW])
+        msg += f"\n{shown}"
+    if stats["truncated"]:
+        msg += f"\n> ✂️ Chỉ xử lý {BULK_MAX_ENTRIES} mục đầu tiên."
+    return msg
+
+
+def run_bulk_command(slack_client, mode: str, channel_id: str, user_id: str, text: str):
+    """Chạy trên slash_jobs: gom token từ text + file Slack, áp dụng, post 1 message."""
+    tokens = _SPLIT_RE.split(text.strip())
+    file_ids = [fid for fid in (find_file_id(t) for t in tokens) if fid]
+    inline = [t for t in tokens if t and not find_file_id(t)]
+
+    def _lines():
+        yield " ".join(inline)
+        for fid in file_ids:
+            yield from iter_file_lines(slack_client, fid)
+
+    try:
+        stats = apply_bulk_add(mode, _lines())
+        msg = format_bulk_summary(mode, stats, user_id)
+    except Exception as e:
+        msg = f"⚠️ Lỗi khi cập nhật {mode}: {e}"
+
+    slack_client.chat_postMessage(channel=channel_id, text=msg)
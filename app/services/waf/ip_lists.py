@@ -0,0 +1,172 @@
+import hashlib
+import os
+import threading
+import time
+from app.services.waf.waf_client import waf_client, MODES
+from app.utils.keyed_lock import KeyedLock
+from app.utils.radix_tree import RadixTree
+
+# ===========================================================
+#  BẢN SAO LOCAL CỦA WHITELIST / BLACKLIST TRÊN WAF
+#  Lưu trong RadixTree (hỗ trợ CIDR) → contains(ip) không cần gọi API.
+#  Refresh định kỳ bằng ETag (If-None-Match → 304); API không có ETag thì
+#  so hash nội dung, chỉ dựng lại cây khi danh sách thật sự đổi.
+# ===========================================================
+REFRESH_INTERVAL = int(os.getenv("WAF_LIST_REFRESH", "60"))
+PAGE_SIZE = int(os.getenv("WAF_LIST_PAGE_SIZE", "50"))
+
+# Hot path chưa có snapshot: tải nền, lần tải lỗi thì chờ N giây mới thử lại
+BACKGROUND_RETRY = float(os.getenv("WAF_LIST_BACKGROUND_RETRY", "30"))
+
+
+class _Snapshot:
+    def __init__(self, entries: list, etag: str = None):
+        self.entries = sorted(entries)
+        self.tree = RadixTree(self.entries)
+        self.etag = etag
+        self.version = hashlib.sha1("\n".join(self.entries).encode()).hexdigest()[:12]
+        self.loaded_at = time.time()
+
+
+class IpListMirror:
+    def __init__(self, interval: int = REFRESH_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        # Mỗi list chỉ 1 lần refresh tại 1 thời điểm (thread định kỳ, tải nền,
+        # apply_bulk_add...): fetch → so ETag/hash → thay cây tuần tự, không để
+        # lần fetch cũ ghi đè snapshot mới
+        self._refresh_locks = KeyedLock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._loading = set()
+        self._last_attempt = {}
+        self.counters = {"refreshes": 0, "not_modified": 0, "unchanged": 0, "rebuilds": 0, "errors": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    # ---------------- refresh ----------------
+    def refresh(self, mode: str) -> bool:
+        """Đồng bộ 1 list từ WAF. Trả về True nếu cây được dựng lại."""
+        with self._refresh_locks.hold(mode):
+            return self._refresh(mode)
+
+    def _refresh(self, mode: str) -> bool:
+        current = self._snapshots.get(mode)
+        self._count("refreshes")
+        try:
+            data, etag = waf_client.list_if_changed(mode, current.etag if current else None)
+        except Exception as e:
+            self._count("errors")
+            print(f"[IP Lists] Refresh {mode} lỗi: {e}")
+            return False
+
+        if data is None:
+            self._count("not_modified")
+            with self._lock:
+                current.loaded_at = time.time()
+            return False
+
+        snapshot = _Snapshot(data.get(mode, []), etag)
+        if current and snapshot.version == current.version:
+            self._count("unchanged")
+            with self._lock:
+                current.etag, current.loaded_at = etag, snapshot.loaded_at
+            return False
+
+        with self._lock:
+            self._snapshots[mode] = snapshot
+        self._count("rebuilds")
+        return True
+
+    def invalidate(self, mode: str = None):
+        """Gọi sau khi bot tự sửa list → refresh sớm ở vòng kế tiếp."""
+        self._wake.set()
+
+    def start(self):
+        if self.interval <= 0 or self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="ip-list-mirror", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            for mode in MODES:
+                self.refresh(mode)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _snapshot(self, mode: str, load: bool = True):
+        snapshot = self._snapshots.get(mode)
+        if snapshot is None and load:
+            # Chưa có bản nào (thread chưa chạy xong lần đầu) → tải đồng bộ
+            self.refresh(mode)
+            snapshot = self._snapshots.get(mode)
+        return snapshot
+
+    def _load_in_background(self, mode: str):
+        """Tải 1 list trên thread riêng (tối đa 1 lần tải / list, giãn cách khi lỗi)."""
+        now = time.monotonic()
+        with self._lock:
+            if mode in self._loading or now - self._last_attempt.get(mode, -BACKGROUND_RETRY) < BACKGROUND_RETRY:
+                return
+            self._loading.add(mode)
+            self._last_attempt[mode] = now
+
+        def _load():
+            try:
+                self.refresh(mode)
+            finally:
+                with self._lock:
+                    self._loading.discard(mode)
+
+        threading.Thread(target=_load, name=f"ip-list-load-{mode}", daemon=True).start()
+
+    # ---------------- tra cứu ----------------
+    def contains(self, mode: str, ip: str) -> bool:
+        # Hot path (Slack event): không bao giờ chờ HTTP; chưa có snapshot = False, tải nền
+        snapshot = self._snapshot(mode, load=False)
+        if snapshot is None:
+            self._load_in_background(mode)
+            return False
+        return snapshot.tree.contains(ip)
+
+    def entries(self, mode: str) -> list:
+        snapshot = self._snapshot(mode)
+        return snapshot.entries if snapshot else []
+
+    def page(self, mode: str, page: int, page_size: int = PAGE_SIZE):
+        """(entries của trang, tổng số entry, tổng số trang). Lỗi tải list → raise."""
+        snapshot = self._snapshot(mode)
+        if snapshot is None:
+            raise RuntimeError(f"chưa tải được {mode} từ WAF")
+        total = len(snapshot.entries)
+        pages = max(1, -(-total // page_size))
+        page = min(max(1, page), pages)
+        start = (page - 1) * page_size
+        return snapshot.entries[start:start + page_size], total, pages
+
+    def format(self) -> str:
+        with self._lock:
+            c = dict(self.counters)
+            snaps = dict(self._snapshots)
+        lists = " | ".join(
+            f"{mode} {len(s.entries)} (v{s.version}, {time.time() - s.loaded_at:.0f}s trước)"
+            for mode, s in snaps.items()
+        ) or "chưa tải"
+        return (
+            "*🌳 WAF IP list mirror*\n"
+            f"> {lists}\n"
+            f"> refreshes {c['refreshes']} | 304 {c['not_modified']} | unchanged {c['unchanged']} | "
+            f"rebuilds {c['rebuilds']} | errors {c['errors']}"
+        )
+
+
+ip_lists = IpListMirror()
+waf_client.on_change.append(ip_lists.invalidate)
+
+
+def start_ip_list_mirror():
+    ip_lists.start()
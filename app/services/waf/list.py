@@ -1,25 +1,14 @@
-import requests
+from app.services.waf.waf_client import MODES
+from app.services.waf.ip_lists import ip_lists
 
-WAF_API_URL = "http://192.168.10.138:5001"
-WAF_API_TOKEN = "testkey123"
-
-def list_ips(mode="whitelist"):
-    """Liệt kê danh sách IP (whitelist hoặc blacklist) từ WAF API."""
+def list_ips(mode="whitelist", page=1):
+    """Liệt kê danh sách IP (whitelist hoặc blacklist) theo trang, đọc từ mirror local."""
     try:
-        if mode not in ["whitelist", "blacklist"]:
+        if mode not in MODES:
             return "⚠️ Sai loại danh sách. Chỉ hỗ trợ whitelist hoặc blacklist."
 
-        resp = requests.get(
-            f"{WAF_API_URL}/{mode}/list",
-            headers={"Authorization": f"Bearer {WAF_API_TOKEN}"},
-            timeout=5
-        )
-        if resp.status_code != 200:
-            return f"⚠️ Lỗi API WAF: {resp.status_code}"
-
-        data_json = resp.json()
-        ips = data_json.get(mode, [])
-        total = data_json.get("total", len(ips))
+        ips, total, pages = ip_lists.page(mode, page)
+        page = min(max(1, page), pages)
 
         if not ips:
             icon = "📭"
@@ -30,7 +19,10 @@ def list_ips(mode="whitelist"):
         title = "Whitelist" if mode == "whitelist" else "Blacklist"
         ip_list = "\n".join([f"• {ip}" for ip in ips])
 
-        return f"*{icon} Danh sách {title} IP ({total} IP)*\n{ip_list}"
+        msg = f"*{icon} Danh sách {title} IP ({total} IP) — trang {page}/{pages}*\n{ip_list}"
+        if page < pages:
+            msg += f"\n_Trang tiếp: `/list ip_{mode} {page + 1}`_"
+        return msg
 
     except Exception as e:
-        return f"⚠️ Không kết nối được API WAF: {e}"
\ No newline at end of file
+        return f"⚠️ Không kết nối được API WAF: {e}"
@@ -0,0 +1,119 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# ===========================================================
+#  CLIENT API QUẢN LÝ WAF (whitelist / blacklist)
+#  1 session keep-alive dùng chung; thao tác nhiều IP chạy song song
+#  trên pool giới hạn, kết quả gom theo từng IP.
+# ===========================================================
+WAF_MGMT_URL = os.getenv("WAF_MGMT_URL", "http://192.168.10.138:5001")
+WAF_API_TOKEN = os.getenv("WAF_API_TOKEN", "testkey123")
+WAF_TIMEOUT = float(os.getenv("WAF_TIMEOUT", "5"))
+WAF_FANOUT_WORKERS = int(os.getenv("WAF_FANOUT_WORKERS", "8"))
+
+MODES = ("whitelist", "blacklist")
+
+# Trạng thái kết quả từng IP
+OK = "ok"
+EXISTS = "exists"       # add: IP đã có trong list (409)
+MISSING = "missing"     # remove: IP không có trong list (404)
+ERROR = "error"
+
+
+class WafClient:
+    def __init__(self, base_url: str = WAF_MGMT_URL, token: str = WAF_API_TOKEN,
+                 workers: int = WAF_FANOUT_WORKERS):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.workers = workers
+        # Callback(mode) sau mỗi lần thêm/xoá thành công (vd. báo mirror refresh)
+        self.on_change = []
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _fanout(self):
+        # Tạo lazy: mỗi worker gunicorn có pool riêng sau khi fork
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="waf-fanout"
+                )
+            return self._pool
+
+    # ---------------- 1 IP ----------------
+    def _post_ip(self, path: str, ip: str, conflict_status: int, conflict: str) -> dict:
+        try:
+            resp = self.session.post(
+                f"{self.base_url}{path}", json={"ip": ip}, timeout=WAF_TIMEOUT
+            )
+        except Exception as e:
+            return {"ip": ip, "status": ERROR, "detail": f"Không kết nối được API WAF: {e}"}
+
+        if resp.status_code == 200:
+            for callback in self.on_change:
+                callback(path.split("/")[1])
+            return {"ip": ip, "status": OK, "detail": None}
+        if resp.status_code == conflict_status:
+            return {"ip": ip, "status": conflict, "detail": None}
+        return {"ip": ip, "status": ERROR, "detail": f"Lỗi API WAF: {resp.status_code} — {resp.text}"}
+
+    def add(self, mode: str, ip: str) -> dict:
+        return self._post_ip(f"/{mode}/add", ip, 409, EXISTS)
+
+    def remove(self, mode: str, ip: str) -> dict:
+        return self._post_ip(f"/{mode}/remove", ip, 404, MISSING)
+
+    def list(self, mode: str) -> dict:
+        """Trả về JSON gốc {"<mode>": [...], "total": N}; lỗi HTTP → raise."""
+        resp = self.session.get(f"{self.base_url}/{mode}/list", timeout=WAF_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json()
+
+    def list_if_changed(self, mode: str, etag: str = None):
+        """
+        GET list kèm If-None-Match. Trả về (None, etag) nếu 304 (không đổi),
+        ngược lại (JSON, etag mới hoặc None nếu API không trả ETag).
+        """
+        headers = {"If-None-Match": etag} if etag else {}
+        resp = self.session.get(f"{self.base_url}/{mode}/list", headers=headers, timeout=WAF_TIMEOUT)
+        if resp.status_code == 304:
+            return None, etag
+        resp.raise_for_status()
+        return resp.json(), resp.headers.get("ETag")
+
+    # ---------------- nhiều IP ----------------
+    def _bulk(self, fn, mode: str, ips) -> list:
+        ips = list(dict.fromkeys(ips))
+        if len(ips) == 1:
+            return [fn(mode, ips[0])]
+        return list(self._fanout().map(lambda ip: fn(mode, ip), ips))
+
+    def bulk_add(self, mode: str, ips) -> list:
+        return self._bulk(self.add, mode, ips)
+
+    def bulk_remove(self, mode: str, ips) -> list:
+        return self._bulk(self.remove, mode, ips)
+
+
+def summarize(results: list) -> dict:
+    """Gom kết quả theo trạng thái: {"ok": [ip...], "exists": [...], ..., "errors": {ip: detail}}."""
+    summary = {OK: [], EXISTS: [], MISSING: [], ERROR: [], "errors": {}}
+    for r in results:
+        summary[r["status"]].append(r["ip"])
+        if r["status"] == ERROR:
+            summary["errors"][r["ip"]] = r["detail"]
+    return summary
+
+
+waf_client = WafClient()
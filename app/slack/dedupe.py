@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from app.services.shared_state import claim_keys, prune_claims, release_claims
+
+# ===========================================================
+#  DEDUPE SLACK EVENT
+#  Key: event_id / client_msg_id / channel:ts
+#  - LRU có TTL trong RAM (O(1), chặn retry trong cùng process)
+#  - claims trong shared_state (chặn trùng giữa các worker process)
+# ===========================================================
+DEDUPE_TTL = float(os.getenv("SLACK_DEDUPE_TTL", "600"))
+DEDUPE_MAX_KEYS = int(os.getenv("SLACK_DEDUPE_MAX_KEYS", "10000"))
+DEDUPE_SHARED = os.getenv("SLACK_DEDUPE_SHARED", "1") == "1"
+
+# Dọn claims hết hạn sau mỗi N lần claim
+_PRUNE_EVERY = 500
+
+
+class TTLSet:
+    """Tập key có hạn sống, giới hạn kích thước theo LRU."""
+
+    def __init__(self, ttl: float, max_keys: int):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            expires_at = self._keys.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._keys[key]
+                return False
+            self._keys.move_to_end(key)
+            return True
+
+    def add(self, key: str):
+        with self._lock:
+            self._keys[key] = time.monotonic() + self.ttl
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._keys.pop(key, None)
+
+
+class EventDeduper:
+    def __init__(self, ttl: float = DEDUPE_TTL, max_keys: int = DEDUPE_MAX_KEYS,
+                 shared: bool = DEDUPE_SHARED):
+        self.ttl = ttl
+        self.shared = shared
+        self._seen = TTLSet(ttl, max_keys)
+        self._lock = threading.Lock()
+        self._claims = 0
+        self.counters = {
+            "checked": 0,
+            "suppressed_local": 0,
+            "suppressed_shared": 0,
+            "suppressed_retry": 0,
+            "retries_processed": 0,
+            "released": 0,
+        }
+
+    @staticmethod
+    def event_keys(payload: dict) -> list:
+        event = payload.get("event", {}) or {}
+        keys = []
+        if payload.get("event_id"):
+            keys.append(f"evt:{payload['event_id']}")
+        if event.get("client_msg_id"):
+            keys.append(f"msg:{event['client_msg_id']}")
+        if event.get("channel") and event.get("ts"):
+            keys.append(f"ts:{event['channel']}:{event['ts']}")
+        return keys
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def is_duplicate(self, payload: dict, retry_num=None) -> bool:
+        """
+        True nếu event đã được xử lý (hoặc đang xử lý) trong TTL.
+        retry_num: giá trị header X-Slack-Retry-Num (nếu có).
+        """
+        self._count("checked")
+        keys = self.event_keys(payload)
+        if not keys:
+            return False
+
+        if any(self._seen.contains(k) for k in keys):
+            self._count("suppressed_retry" if retry_num else "suppressed_local")
+            return True
+
+        if self.shared:
+            with self._lock:
+                self._claims += 1
+                prune = self._claims % _PRUNE_EVERY == 0
+            if prune:
+                prune_claims()
+            if not claim_keys(keys, self.ttl):
+                for k in keys:
+                    self._seen.add(k)
+                self._count("suppressed_retry" if retry_num else "suppressed_shared")
+                return True
+
+        for k in keys:
+            self._seen.add(k)
+        if retry_num:
+            # Retry của event mà chưa process nào thấy (vd. lần đầu bị mất) → vẫn xử lý
+            self._count("retries_processed")
+        return False
+
+    def release(self, payload: dict):
+        """
+        Bỏ đánh dấu event đã claim nhưng không xử lý được (vd. hàng đợi đầy)
+        để Slack retry của event đó không bị chặn như bản trùng.
+        """
+        keys = self.event_keys(payload)
+        for k in keys:
+            self._seen.discard(k)
+        if self.shared:
+            release_claims(keys)
+        self._count("released")
+
+    def format(self) -> str:
+        with self._lock:
+            c = dict(self.counters)
+        return (
+            "*🔁 Slack event dedupe*\n"
+            f"> checked {c['checked']} | suppressed: local {c['suppressed_local']}, "
+            f"shared {c['suppressed_shared']}, retry {c['suppressed_retry']} | "
+            f"retries processed {c['retries_processed']} | released {c['released']}"
+        )
+
+
+event_deduper = EventDeduper()
@@ -0,0 +1,58 @@
+import fcntl
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """
+    Khoá liên tiến trình bằng flock trên 1 file .lock.
+    shared=True cho phép nhiều tiến trình cùng đọc.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def try_lock(path: str):
+    """
+    Lấy khoá độc quyền KHÔNG chờ (dùng để bầu leader giữa các worker).
+    Trả về file object đang giữ khoá (giữ nó sống = giữ khoá), None nếu process khác đã giữ.
+    Khoá tự nhả khi process chết.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, "a")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def run_as_leader(lock_path: str, interval: float, fn, stop_event, leader_event=None):
+    """
+    Vòng lặp job nền chỉ chạy ở 1 worker: mỗi `interval` giây, process giữ
+    try_lock(lock_path) gọi fn(); process khác thử lấy khoá mỗi vòng nên tự lên
+    thay khi leader chết. leader_event (nếu có) được set khi process này là leader.
+    Chạy tới khi stop_event được set, lúc đó nhả khoá.
+    """
+    lock_file = None
+    try:
+        while not stop_event.is_set():
+            if lock_file is None:
+                lock_file = try_lock(lock_path)
+                if lock_file is not None and leader_event is not None:
+                    leader_event.set()
+            if lock_file is not None:
+                fn()
+            stop_event.wait(interval)
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+        if leader_event is not None:
+            leader_event.clear()
@@ -0,0 +1,28 @@
+import threading
+from contextlib import contextmanager
+
+
+class KeyedLock:
+    """
+    Lock riêng cho từng key (vd. IP) trong process; tự dọn khi không còn ai giữ/chờ.
+    Các thread khác key không chặn nhau.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        # key → [lock, số thread đang giữ/chờ]
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
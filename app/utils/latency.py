@@ -0,0 +1,48 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class LatencyRecorder:
+    """Đếm số lần / tổng / max thời gian (giây) theo từng tên (stage, endpoint…)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name: str, seconds: float, ok: bool = True):
+        with self._lock:
+            s = self._stats.setdefault(name, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0})
+            s["count"] += 1
+            if not ok:
+                s["errors"] += 1
+            s["total"] += seconds
+            s["max"] = max(s["max"], seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        started = time.monotonic()
+        ok = True
+        try:
+            yield
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            self.record(name, time.monotonic() - started, ok)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: dict(s, avg=s["total"] / s["count"] if s["count"] else 0.0)
+                for name, s in self._stats.items()
+            }
+
+    def format(self, title: str) -> str:
+        lines = [title]
+        for name, s in self.snapshot().items():
+            lines.append(
+                f"> `{name}`: {s['count']} calls | errors {s['errors']} | "
+                f"avg {s['avg'] * 1000:.0f}ms | max {s['max'] * 1000:.0f}ms"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,61 @@
+import ipaddress
+
+
+class RadixTree:
+    """
+    Cây tiền tố nhị phân (mỗi bit 1 tầng) chứa IP/CIDR, tách theo IPv4/IPv6.
+    contains(ip) duyệt tối đa 32/128 bit: thời gian tra cứu không phụ thuộc số entry.
+    """
+
+    def __init__(self, entries=()):
+        # node = [con bit 0, con bit 1, entry gốc nếu có prefix kết thúc tại đây]
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self.size = 0
+        for entry in entries:
+            self.insert(entry)
+
+    def insert(self, entry: str) -> bool:
+        """Thêm IP/CIDR; trả về False nếu entry không hợp lệ."""
+        try:
+            net = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            return False
+
+        bits = int(net.network_address)
+        width = net.max_prefixlen
+        node = self._roots[net.version]
+        for i in range(net.prefixlen):
+            bit = (bits >> (width - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            self.size += 1
+        node[2] = entry
+        return True
+
+    def match(self, ip: str):
+        """Entry (IP/CIDR) ngắn nhất chứa ip, None nếu không có."""
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+        bits = int(addr)
+        width = addr.max_prefixlen
+        node = self._roots[addr.version]
+        for i in range(width + 1):
+            if node[2] is not None:
+                return node[2]
+            if i == width:
+                break
+            node = node[(bits >> (width - 1 - i)) & 1]
+            if node is None:
+                return None
+        return None
+
+    def contains(self, ip: str) -> bool:
+        return self.match(ip) is not None
+
+    def __len__(self):
+        return self.size
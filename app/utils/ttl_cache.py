@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """1 lần load đang chạy cho 1 key; các request trùng key chờ trên event."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    Cache kết quả theo key trong ttl giây (LRU, giới hạn max_keys).
+    get_or_load gộp các lần gọi đồng thời cùng key thành 1 lần load (single-flight).
+    Giá trị trả về dùng chung giữa các caller → không được sửa tại chỗ.
+    """
+
+    def __init__(self, ttl: float, max_keys: int = 256):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._inflight = {}
+        self.counters = {"hits": 0, "misses": 0, "collapsed": 0, "errors": 0}
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[1]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.counters["misses"] += 1
+            else:
+                self.counters["collapsed"] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except Exception as e:
+            # Lỗi không cache → lần gọi sau sẽ load lại
+            flight.error = e
+            with self._lock:
+                self.counters["errors"] += 1
+            raise
+        else:
+            with self._lock:
+                self._data[key] = (time.monotonic() + self.ttl, flight.value)
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_keys:
+                    self._data.popitem(last=False)
+            return flight.value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def format(self, title: str) -> str:
+        with self._lock:
+            c = dict(self.counters)
+            size = len(self._data)
+        lookups = c["hits"] + c["misses"] + c["collapsed"]
+        hit_rate = (c["hits"] + c["collapsed"]) / lookups * 100 if lookups else 0.0
+        return (
+            f"{title}\n"
+            f"> hits {c['hits']} | misses {c['misses']} | collapsed {c['collapsed']} | "
+            f"errors {c['errors']} | hit rate {hit_rate:.0f}% | "
+            f"entries {size} | ttl {self.ttl:g}s"
+        )
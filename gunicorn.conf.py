@@ -0,0 +1,16 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py run:app
+#
+# Chạy được nhiều worker vì state dùng chung nằm trên đĩa:
+# - case_store: SQLite WAL (CASE_STORE_BACKEND=sqlite, KHÔNG dùng "json")
+# - alert_log_store: journal + flock, mỗi worker tự bắt kịp thay đổi
+# - shared_state: SQLite WAL cho claim dedupe Slack event và watermark của case_reconciler
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+
+# Mỗi worker tự mở connection SQLite sau khi fork
+preload_app = False
@@ -0,0 +1,72 @@
+import pytest
+
+from app.services.waf import alert_log_store, case_store
+from app.services.waf.alert_log_store import AlertLogRepository, save_alert_log, update_alert_log, remove_alert_log
+from app.services.waf.case_backends import SqliteCaseBackend, JsonCaseBackend
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        backend = SqliteCaseBackend(str(tmp_path / "cases.db"), json_path=None)
+    else:
+        backend = JsonCaseBackend(str(tmp_path / "cases.json"))
+    monkeypatch.setattr(case_store, "_backend", backend)
+    monkeypatch.setattr(alert_log_store, "alert_logs", AlertLogRepository(
+        str(tmp_path / "alert_logs.json"),
+        str(tmp_path / "alert_logs.journal"),
+        str(tmp_path / "alert_logs.lock"),
+    ))
+    return case_store
+
+
+def _mark_fp(alert_id):
+    # Giống /mark-fp: đánh dấu FP rồi gỡ alert khỏi case đang mở
+    def _mark(info):
+        info["status"] = "FP"
+        return info
+
+    update_alert_log(alert_id, _mark)
+    return case_store.detach_alert(alert_id)
+
+
+def _case_ids(cases):
+    return sorted(c["case_id"] for c in cases)
+
+
+def test_all_fp_finds_case_after_mark_fp(store):
+    store.save_case("10.0.0.1", "c1")
+    for aid in ("a1", "a2"):
+        save_alert_log(aid, {"client_ip": "10.0.0.1", "status": "open"})
+    store.append_alerts("c1", ["a1", "a2"])
+
+    # Alert còn lại không còn log (vd. /clear-logs) → không còn gì cần xử lý
+    remove_alert_log("a2")
+    assert _mark_fp("a1") == (1, [])
+
+    assert _case_ids(store.find_open_cases(all_fp=True)) == ["c1"]
+
+
+def test_all_fp_finds_fp_alert_attached_after_mark_fp(store):
+    # Alert bị mark FP khi còn trong batcher, được gắn vào case sau đó
+    store.save_case("10.0.0.2", "c2")
+    save_alert_log("a3", {"client_ip": "10.0.0.2", "status": "open"})
+    assert _mark_fp("a3") == (0, [])
+    store.append_alerts("c2", ["a3"])
+
+    assert _case_ids(store.find_open_cases(all_fp=True)) == ["c2"]
+
+
+def test_all_fp_skips_live_and_empty_cases(store):
+    # Case còn alert thật
+    store.save_case("10.0.0.3", "c3")
+    for aid in ("a4", "a5"):
+        save_alert_log(aid, {"client_ip": "10.0.0.3", "status": "open"})
+    store.append_alerts("c3", ["a4", "a5"])
+    _mark_fp("a4")
+
+    # Case vừa tạo, alert chưa được batcher ghi vào
+    store.save_case("10.0.0.4", "c4")
+
+    assert store.find_open_cases(all_fp=True) == []
+    assert _case_ids(store.find_open_cases()) == ["c3", "c4"]